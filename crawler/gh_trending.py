@@ -1,96 +1,132 @@
+import aiohttp
+import asyncio
 import requests
-import json
-import time
 import os
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from datetime import datetime, timedelta
-from github import Github
+from utils.session import create_session
+from utils.storage import update_json
+
+# Raw file host serving README files directly, outside of the REST API rate limit
+README_RAW_URL = "https://raw.githubusercontent.com/{repo_fullname}/HEAD/{filename}"
+# README file names tried in order until one exists
+README_FILENAMES = ("README.md", "README.rst", "readme.md", "README.markdown")
+# Upper bound of README requests in flight, to stay clear of GitHub rate limits
+MAX_CONCURRENT_REQUESTS = 5
+
 
 class GithubTrendingScraper:
     """
     A scraper class to fetch trending repositories from GitHub
     and save their details, including README content, to a JSON file.
     """
-    def __init__(self):
+    def __init__(self, time_stamp: str = None):
         """
         Initializes the scraper with a GitHub instance.
         :param token: A GitHub Personal Access Token for higher API rate limits.
+        :param time_stamp: The "%Y%m%d" date of the daily JSON file to write, today if not given.
         """
+        self.time_stamp = datetime.now().strftime('%Y%m%d') if time_stamp is None else time_stamp
         self.token = os.getenv("GITHUB_TOKEN")
-        self.github_instance = Github(self.token)
         self.output_dir = "materials"
         self.trending_url = "https://github.com/trending"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.session = create_session(self.headers)
+        self.readme_headers = {}
+        if self.token:
+            self.readme_headers['Authorization'] = f"token {self.token}"
 
-    def _get_repo_details(self, repo_fullname):
+    async def _get_repo_details(self, session, semaphore, repo_fullname):
         """
-        Fetches the README content for a single repository using PyGithub.
+        Fetches the README content for a single repository from raw.githubusercontent.com.
+        :param session: The shared aiohttp.ClientSession.
+        :param semaphore: The asyncio.Semaphore bounding concurrent requests.
         :param repo_fullname: The full name of the repository, e.g., "octocat/Spoon-Knife".
         :return: The README text content or an error message.
         """
         try:
-            # Use the PyGithub instance to get the repository object
-            repo = self.github_instance.get_repo(repo_fullname)
-            
-            # Get the README file content
-            try:
-                # get_readme() returns a ContentFile object
-                readme_contents = repo.get_readme()
-                # The decoded_content attribute holds the content, which needs to be decoded
-                readme_text = readme_contents.decoded_content.decode('utf-8')
-            except Exception:
+            async with semaphore:
+                print(f"Fetching details for {repo_fullname}...")
+                for filename in README_FILENAMES:
+                    url = README_RAW_URL.format(repo_fullname=repo_fullname, filename=filename)
+                    async with session.get(url) as response:
+                        if response.status == 200:
+                            return await response.text(encoding='utf-8')
+                        if response.status != 404:
+                            return f"An error occurred while fetching README: HTTP {response.status}"
+
                 readme_text = "README not found."
                 print(f"WARNING: {readme_text}")
-                
-            return readme_text
+                return readme_text
         except Exception as e:
             return f"An error occurred while fetching README: {e}"
 
+    async def _get_readmes(self, repo_fullnames):
+        """
+        Fetches the README content for several repositories concurrently.
+        :param repo_fullnames: A list of repository full names.
+        :return: A list of README texts, in the same order as repo_fullnames.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(headers=self.readme_headers, timeout=timeout) as session:
+            return await asyncio.gather(
+                *[self._get_repo_details(session, semaphore, name) for name in repo_fullnames]
+            )
+
     def _get_trending_repos(self):
         """
         Scrapes the top 10 trending repositories from GitHub's trending page.
         :return: A list of dictionaries with repository details, or None on failure.
         """
         try:
-            response = requests.get(self.trending_url, headers=self.headers)
+            response = self.session.get(self.trending_url, timeout=10)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                repo_list = soup.find_all('article', class_='Box-row')
+                # Only build the repository cards, not the whole page DOM. The strainer
+                # sees the raw class attribute string, so match Box-row as one token
+                only_repos = SoupStrainer(
+                    'article', class_=lambda c: c and 'Box-row' in c.split()
+                )
+                # Parse the raw bytes directly, skipping requests' charset sniffing
+                soup = BeautifulSoup(
+                    response.content, 'lxml', parse_only=only_repos, from_encoding='utf-8'
+                )
+                # Scrape only the top 10 repositories
+                repo_list = soup.select('article.Box-row', limit=10)
                 
                 trending_repos = []
-                # Scrape only the top 10 repositories
-                for repo in repo_list[:10]:
-                    title_tag = repo.find('h2').find('a')
+                repo_fullnames = []
+                for repo in repo_list:
+                    title_tag = repo.select_one('h2 > a')
                     repo_path = title_tag['href'] if title_tag else None
                     
                     # Extract description
-                    description_tag = repo.find('p')
+                    description_tag = repo.select_one('p')
                     description = description_tag.get_text(strip=True) if description_tag else 'No description provided.'
                     
                     # Extract language
-                    language_tag = repo.find('span', itemprop='programmingLanguage')
+                    language_tag = repo.select_one('span[itemprop=programmingLanguage]')
                     language = language_tag.get_text(strip=True) if language_tag else 'Unknown'
                     
                     if repo_path:
                         # Get the full repository name, e.g., "octocat/Spoon-Knife"
                         repo_fullname = repo_path.strip('/')
-                        
-                        print(f"Fetching details for {repo_fullname}...")
-                        # Call the method to get README content
-                        readme_content = self._get_repo_details(repo_fullname)
+                        repo_fullnames.append(repo_fullname)
                         
                         repo_info = {
                             'url': f"https://github.com/{repo_fullname}",
                             'language': language,
                             'description': description,
-                            'readme_summary': readme_content
                         }
                         trending_repos.append(repo_info)
-                        
-                        time.sleep(1) # Pause to avoid triggering rate limits
+                
+                # Fetch all README contents concurrently instead of one by one
+                readmes = asyncio.run(self._get_readmes(repo_fullnames))
+                for repo_info, readme_content in zip(trending_repos, readmes):
+                    repo_info['readme_summary'] = readme_content
                 
                 return trending_repos
             else:
@@ -108,26 +144,12 @@ class GithubTrendingScraper:
         # Create the materials directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
         
-        # Generate the filename with the current date
-        timestamp = (datetime.now()).strftime('%Y%m%d')
-        filename = os.path.join(self.output_dir, f"{timestamp}.json")
-        
-        # Load existing data if the file exists, otherwise start with an empty dictionary
-        output_data = {}
-        if os.path.exists(filename):
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    output_data = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError) as e:
-                print(f"Warning: Could not read existing JSON file. Creating a new one. Error: {e}")
-                output_data = {}
-        
-        # Update the specific key and save the entire object
-        output_data['gh_trendings'] = data
+        # The daily file of this run, even if the crawl went past midnight
+        filename = os.path.join(self.output_dir, f"{self.time_stamp}.json")
         
+        # Update the specific key, keeping the keys written by the other scrapers
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=4)
+            update_json(filename, {'gh_trendings': data})
             print(f"Successfully saved data to {filename}")
         except Exception as e:
             print(f"An error occurred while saving the file: {e}")
@@ -1,13 +1,26 @@
 import requests
 import json
-import arxiv
+import re
 import sys
 import os
+import glob
+import threading
 sys.path.append(os.getcwd())
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from datetime import datetime, timedelta
+from xml.etree import ElementTree
 from utils.log import setup_logging_config
+from utils.session import create_session
+from utils.storage import load_json, save_json, update_json
+
+# Official arXiv export API, answering with an Atom feed
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+ATOM_NAMESPACE = {"atom": "http://www.w3.org/2005/Atom"}
+# Matches a new-style arXiv ID, e.g. "2508.11630"
+ARXIV_ID_RE = re.compile(r"(\d{4}\.\d{4,5})")
+# Matches the version suffix of an arXiv short ID, e.g. "v1" in "2508.11630v1"
+ARXIV_VERSION_RE = re.compile(r"v\d+$")
 
 
 class LinkConverter:
@@ -27,15 +40,79 @@ class LinkConverter:
             str: The corresponding arXiv link (e.g., https://arxiv.org/abs/2508.11630).
         """
         # The arXiv ID is at the end of the URL path
-        arxiv_id = hf_link.split("/")[-1]
+        match = ARXIV_ID_RE.search(hf_link)
+        arxiv_id = match.group(1) if match else hf_link.split("/")[-1]
         return f"https://arxiv.org/abs/{arxiv_id}"
 
 
 class ArxivScraper:
     """
     Scrapes paper information from arXiv using the official API.
+
+    Fetched details are cached on disk for the current day, since arXiv only
+    updates once a day and re-runs would otherwise query the same IDs again.
     """
 
+    CACHE_PREFIX = ".arxiv_cache_"
+
+    def __init__(
+        self, cache_dir: str = "materials", session: requests.Session | None = None
+    ):
+        """
+        Initializes the scraper and loads today's on-disk cache.
+
+        Args:
+            cache_dir (str): The directory holding the daily cache files.
+            session (requests.Session | None): The session used for API calls,
+                                               a new pooled one if None.
+        """
+        self.cache_dir = cache_dir
+        self.cache_path = os.path.join(
+            self.cache_dir,
+            f"{self.CACHE_PREFIX}{datetime.now().strftime('%Y%m%d')}.json",
+        )
+        self._cache_lock = threading.Lock()
+        self.logger = setup_logging_config()
+        # one keep-alive session with retries for the whole run
+        self.session = create_session() if session is None else session
+        self._remove_stale_caches()
+        self.cache = self._load_cache()
+
+    def _remove_stale_caches(self):
+        """
+        Deletes cache files left over from previous days.
+        """
+        pattern = os.path.join(self.cache_dir, f"{self.CACHE_PREFIX}*.json")
+        for path in glob.glob(pattern):
+            if path != self.cache_path:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Warning: Could not remove stale arXiv cache {path}: {e}")
+
+    def _load_cache(self) -> dict:
+        """
+        Loads today's cache file.
+
+        Returns:
+            dict: A mapping from arXiv ID to its cached details.
+        """
+        try:
+            return load_json(self.cache_path)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    def _save_cache(self):
+        """
+        Writes the in-memory cache back to today's cache file.
+        """
+        with self._cache_lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                save_json(self.cache_path, self.cache)
+            except Exception as e:
+                print(f"Warning: Could not write arXiv cache: {e}")
+
     def get_paper_details(self, arxiv_id: str) -> dict:
         """
         Fetches the summary and PDF link for a given arXiv paper ID.
@@ -46,22 +123,67 @@ class ArxivScraper:
         Returns:
             dict: A dictionary containing the summary and PDF link, or N/A.
         """
-        self.logger = setup_logging_config()
-        try:
-            client = arxiv.Client()
-            search = arxiv.Search(id_list=[arxiv_id], max_results=1)
-            results = list(client.results(search))
+        return self.get_many([arxiv_id])[arxiv_id]
 
-            if results:
-                paper = results[0]
-                print(paper.summary)
-                return {"Summary": paper.summary, "PDF_Link": paper.pdf_url}
-            else:
-                return {"Summary": "N/A", "PDF_Link": "N/A"}
+    def get_many(self, arxiv_ids: list[str]) -> dict[str, dict]:
+        """
+        Fetches the summaries and PDF links for several arXiv papers at once.
+
+        IDs already in today's cache are served locally; the remaining ones are
+        sent to the export API in a single `id_list` query, so the whole batch costs at most one
+        API round-trip instead of one per paper.
+
+        Args:
+            arxiv_ids (list[str]): The arXiv paper IDs (e.g., ['2508.06429']).
+
+        Returns:
+            dict[str, dict]: A mapping from each requested ID to a dictionary
+                             containing the summary and PDF link, or N/A.
+        """
+        details = {
+            arxiv_id: self.cache.get(arxiv_id, {"Summary": "N/A", "PDF_Link": "N/A"})
+            for arxiv_id in arxiv_ids
+        }
+        missing_ids = [arxiv_id for arxiv_id in details if arxiv_id not in self.cache]
+        if not missing_ids:
+            return details
+
+        try:
+            response = self.session.get(
+                ARXIV_API_URL,
+                params={"id_list": ",".join(missing_ids), "max_results": len(missing_ids)},
+                timeout=30,
+            )
+            response.raise_for_status()
+            feed = ElementTree.fromstring(response.content)
+
+            for entry in feed.iterfind("atom:entry", ATOM_NAMESPACE):
+                # id looks like http://arxiv.org/abs/2508.06429v1
+                entry_id = entry.findtext("atom:id", "", ATOM_NAMESPACE)
+                arxiv_id = ARXIV_VERSION_RE.sub("", entry_id.rsplit("/abs/", 1)[-1])
+                if arxiv_id not in details:
+                    # error entries for malformed IDs carry no paper
+                    continue
+
+                # the feed wraps abstracts over several lines, join them back with spaces
+                summary = " ".join(entry.findtext("atom:summary", "N/A", ATOM_NAMESPACE).split())
+                pdf_link = next(
+                    (
+                        link.get("href")
+                        for link in entry.iterfind("atom:link", ATOM_NAMESPACE)
+                        if link.get("title") == "pdf"
+                    ),
+                    "N/A",
+                )
+                self.logger.debug("%s: %s", arxiv_id, summary)
+                details[arxiv_id] = {"Summary": summary, "PDF_Link": pdf_link}
+                self.cache[arxiv_id] = details[arxiv_id]
 
         except Exception as e:
             print(f"Error Getting arxiv: {e}")
-            return {"Summary": "N/A", "PDF_Link": "N/A"}
+
+        self._save_cache()
+        return details
 
 
 class HuggingFacePaperScraper:
@@ -79,91 +201,100 @@ class HuggingFacePaperScraper:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
 
-    def __init__(self, date_str: str = None):
+    def __init__(self, date_str: str = None, time_stamp: str = None):
         """
         Initializes the scraper with a specific date and mirror URL.
 
         Args:
             date_str (str): The date string in 'YYYY-MM-DD' format.
+            time_stamp (str): The "%Y%m%d" date of the daily JSON file to write,
+                              today if not given.
         """
         self.date_str = (
             (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d") if date_str is None else date_str
         )
+        self.time_stamp = datetime.now().strftime("%Y%m%d") if time_stamp is None else time_stamp
         # Combine the mirror URL with the relative path to the papers page
         self.url = f"{self.HF_MIRROR_URL}/papers/date/{self.date_str}"
         print(f"HuggingFace Page URL:{self.url}")
         self.link_convert = LinkConverter()
-        self.arxiv_scraper = ArxivScraper()
         self.logger = setup_logging_config()
+        self.session = create_session(self.HEADERS)
+        self.arxiv_scraper = ArxivScraper(session=self.session)
 
-    def _fetch_page_content(self) -> str | None:
+    def _fetch_page_content(self) -> bytes | None:
         """
         Fetches the HTML content of the target URL.
 
         Returns:
-            str | None: The HTML content as a string, or None if the request failed.
+            bytes | None: The raw HTML content, or None if the request failed.
         """
         print("Fetching Page content.")
         try:
-            response = requests.get(self.url, headers=self.HEADERS, timeout=10)
+            response = self.session.get(self.url, timeout=10)
             response.raise_for_status()
-            return response.text
+            # Hand the raw bytes to the parser, skipping requests' charset sniffing
+            return response.content
         except requests.exceptions.RequestException as e:
             print(f"Error: {e}")
             return None
 
-    def _parse_papers(self, html_content: str) -> list[dict]:
+    def _parse_papers(self, html_content: bytes) -> list[dict]:
         """
         Parses the HTML content to extract paper details.
 
         Args:
-            html_content (str): The HTML content of the page.
+            html_content (bytes): The UTF-8 encoded HTML content of the page.
 
         Returns:
             list[dict]: A list of dictionaries, where each dictionary
                         represents a paper with its title and link.
         """
-        soup = BeautifulSoup(html_content, "html.parser")
+        # Only build the <h3> headings holding paper titles, not the whole page DOM
+        soup = BeautifulSoup(
+            html_content, "lxml", parse_only=SoupStrainer("h3"), from_encoding="utf-8"
+        )
         papers_list = []
         
-        papers_containers = soup.find_all("h3", class_="mb-1 text-lg/6 font-semibold hover:underline peer-hover:underline 2xl:text-[1.2rem]/6")
+        # Match the paper anchors structurally, independent of the Tailwind classes
+        title_link_tags = soup.select("h3 a[href^='/papers/']")
 
-        if not papers_containers:
+        if not title_link_tags:
             print("Error, no paper message")
             return papers_list
         
         print("Getting Paper messages")
-        arxiv_scraper = ArxivScraper()
-        print(f"Paper numbers: {len(papers_containers)}")
-        for container in papers_containers:
-            try:
-                title_link_tag = container.find("a")
-                title = title_link_tag.get_text(strip=True).replace("\n", "")
-                print(title)
-                # Ensure the link uses the mirror URL
-                relative_link = title_link_tag['href']
-                hf_link = f"{self.HF_MIRROR_URL}{relative_link}"
-                
-                # Convert the Hugging Face link to an arXiv link
-                arxiv_link = LinkConverter.to_arxiv(hf_link)
-                print(arxiv_link)
-                # Extract arXiv ID
-                arxiv_id = arxiv_link.split('/')[-1]
-
-                # Fetch details from arXiv API
-                arxiv_details = arxiv_scraper.get_paper_details(arxiv_id)
-
-                papers_list.append({
-                    "Title": str(title).replace("\n", ""),
-                    "HF_Link": hf_link,
-                    "Arxiv_Link": arxiv_link,
-                    "Summary": str(arxiv_details["Summary"]).replace("\n", ""),
-                    "PDF_Link": arxiv_details["PDF_Link"]
-                })
-            except Exception as e:
-                print(f"Error: {e}")
+        print(f"Paper numbers: {len(title_link_tags)}")
+        arxiv_ids = []
+        for title_link_tag in title_link_tags:
+            relative_link = title_link_tag.get('href', "")
+            # Skip links without an arXiv ID, they would only cause a failing API call
+            match = ARXIV_ID_RE.search(relative_link)
+            if not match:
+                self.logger.debug("Skipping non-arXiv paper link: %s", relative_link)
                 continue
 
+            title = title_link_tag.get_text(strip=True).replace("\n", "")
+            # Ensure the link uses the mirror URL
+            hf_link = f"{self.HF_MIRROR_URL}{relative_link}"
+            
+            # Convert the Hugging Face link to an arXiv link
+            arxiv_link = LinkConverter.to_arxiv(hf_link)
+            self.logger.debug("%s: %s", title, arxiv_link)
+
+            arxiv_ids.append(match.group(1))
+            papers_list.append({
+                "Title": str(title).replace("\n", ""),
+                "HF_Link": hf_link,
+                "Arxiv_Link": arxiv_link,
+            })
+
+        # Fetch details for all papers from arXiv API in one batch
+        arxiv_details = self.arxiv_scraper.get_many(arxiv_ids)
+        for paper, arxiv_id in zip(papers_list, arxiv_ids):
+            paper["Summary"] = str(arxiv_details[arxiv_id]["Summary"]).replace("\n", "")
+            paper["PDF_Link"] = arxiv_details[arxiv_id]["PDF_Link"]
+
         return papers_list
 
     def _save(self, new_data: list[dict]):
@@ -173,23 +304,12 @@ class HuggingFacePaperScraper:
         Args:
             data (list[dict]): The list of paper data.
         """
-        self.date_str = (datetime.now()).strftime("%Y%m%d")
         if not new_data:
             print("No data")
             return
         try:
-            with open(f"materials/{self.date_str}.json", "r", encoding="utf-8") as file:
-                data = json.load(file)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            print(f"Warning: Could not read existing JSON file. Error: {e}")
-            data = {}
-
-        data["huggingface_papers"] = new_data
-
-        try:
-            with open(f"materials/{self.date_str}.json", "w", encoding="utf-8") as file:
-                json.dump(data, file, ensure_ascii=False, indent=4)
-                print(f"Successfully writing files into {self.date_str}.json")
+            update_json(f"materials/{self.time_stamp}.json", {"huggingface_papers": new_data})
+            print(f"Successfully writing files into {self.time_stamp}.json")
         except Exception as e:
             print(f"An error occurred while saving the file: {e}")
 
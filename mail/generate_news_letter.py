@@ -1,102 +1,23 @@
+import io
+import itertools
 import json
 import os
+import re
+import sys
 from datetime import date
+from typing import Iterable, Optional
+from jinja2 import Environment
 from tqdm import tqdm
 
-
-class NewsLetterGenerator:
-    def __init__(
-        self,
-        time_stamp: str,
-        template_file_path: str = "./mail/email_template.html",
-        output_dir: str = "./materials",
-    ):
-        # several configs
-        self.time_stamp = time_stamp
-        self.template_file_path = template_file_path
-        self.output_dir = output_dir
-        self.global_config = {
-            "PaperPulse: Your Daily Latest Paper Acquisition Assistant": f"PaperPulse for {self.time_stamp}: Your Daily Latest Paper Acquisition Assistant",
-            "📅 Date: XXXX-XX-XX": f"📅 Date: {self.time_stamp}",
-        }
-
-        # write and create some files
-        os.makedirs(self.output_dir, exist_ok=True)
-        if not os.path.exists(self.template_file_path):
-            print(
-                f"Error! The template mailing file path: {self.template_file_path} doesn't exists."
-            )
-
-    def generate_article_html(self):
-        try:
-            with open(self.template_file_path, "r", encoding="utf-8") as f:
-                template_content = f.read()
-        except FileNotFoundError as e:
-            print(f"Error, could not found file: {e}")
-            return
-
-        html_insert_content = ""
-        target_json_file = os.path.join(self.output_dir, f"{self.time_stamp}.json")
-        with open(target_json_file, "r", encoding="utf-8") as file:
-            file_data = json.load(file)
-            paper_data = file_data["huggingface_papers"]
-            l2_summary_data = file_data["L2 Summary"]
-            l1_summary_data = file_data["L1 Summary"]
-
-        length_of_data = len(paper_data)
-        for index, paper_info in tqdm(enumerate(paper_data), total=length_of_data):
-            html_insert_content += self.simple_format(
-                title=paper_info["Title"],
-                abstract_en=paper_info["Summary"],
-                summary_cn=l2_summary_data[index],
-                link=paper_info["PDF_Link"],
-            )
-
-        final_html = template_content
-        for key, value in self.global_config.items():
-            final_html = final_html.replace(key, value)
-            
-        # replace tldr
-        final_html = final_html.replace("[GLOBAL_TLDR_SUMMARY]", l1_summary_data)
-
-        START_MARKER = "<!-- START: 论文解读块模板 - Python脚本将填充此位置 -->"
-        END_MARKER = "<!-- END: 论文解读块模板 -->"
-
-        try:
-            start_index = final_html.find(START_MARKER)
-            end_index = final_html.find(END_MARKER) + len(END_MARKER)
-
-            if start_index != -1 and end_index != -1:
-                final_html = (
-                    final_html[:start_index]
-                    + html_insert_content
-                    + final_html[end_index:]
-                )
-            else:
-                final_html = final_html.replace(
-                    "<!-- INSERT_ARTICLES_HERE -->", html_insert_content
-                )
-
-        except Exception as e:
-            print(f"Error while replacing articles: {e}")
-            return
-
-        try:
-            save_path = os.path.join(self.output_dir, f"{self.time_stamp}.html")
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(final_html)
-        except Exception as e:
-            print(f"Error: {e}")
-
-    def simple_format(self, title: str, abstract_en: str, summary_cn: str, link: str):
-        article_block_template = """
+# compiled once to python code, html special chars in the paper data are escaped
+ARTICLE_BLOCK_TEMPLATE = Environment(autoescape=True, auto_reload=False).from_string("""
                             <!-- START: ARTICLE BLOCK -->
                             <table border="0" cellpadding="0" cellspacing="0" width="100%" style="border-collapse: collapse; margin-bottom: 25px; border: 1px solid #93c5fd; border-radius: 6px;">
                                 <tr>
                                     <td style="padding: 20px 20px; background-color: #eff6ff;">
                                         <!-- 论文标题 (深蓝) -->
                                         <h2 style="margin: 0 0 15px 0; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; font-size: 22px; color: #1e3a8a; font-weight: 700; line-height: 30px;">
-                                            {title}
+                                            {{ title }}
                                         </h2>
 
                                         <!-- 英文摘要 -->
@@ -104,7 +25,7 @@ class NewsLetterGenerator:
                                             English Abstract:
                                         </h3>
                                         <p style="margin: 0 0 15px 0; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; font-size: 16px; color: #475569; line-height: 24px;">
-                                            {abstract_en}
+                                            {{ abstract_en }}
                                         </p>
                                         
                                         <!-- 中文简略概括 -->
@@ -112,14 +33,14 @@ class NewsLetterGenerator:
                                             中文简析:
                                         </h3>
                                         <p style="margin: 0 0 20px 0; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; font-size: 16px; color: #475569; line-height: 24px;">
-                                            {summary_cn}
+                                            {{ summary_cn }}
                                         </p>
 
                                         <!-- 链接按钮 (居中) -->
                                         <table border="0" cellpadding="0" cellspacing="0" align="center" style="margin: auto;">
                                             <tr>
                                                 <td align="center" style="border-radius: 4px;" bgcolor="#3b82f6">
-                                                    <a href="{link}" target="_blank" style="font-size: 15px; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #ffffff; text-decoration: none; border-radius: 4px; padding: 10px 20px; border: 1px solid #3b82f6; display: inline-block; font-weight: 600;">
+                                                    <a href="{{ link }}" target="_blank" style="font-size: 15px; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #ffffff; text-decoration: none; border-radius: 4px; padding: 10px 20px; border: 1px solid #3b82f6; display: inline-block; font-weight: 600;">
                                                         阅读完整解读 &rarr;
                                                     </a>
                                                 </td>
@@ -129,8 +50,142 @@ class NewsLetterGenerator:
                                 </tr>
                             </table>
                             <!-- END: ARTICLE BLOCK -->
-                            """
-        return article_block_template.format(
+                            """)
+
+# markers in the mailing template
+START_MARKER = "<!-- START: 论文解读块模板 - Python脚本将填充此位置 -->"
+END_MARKER = "<!-- END: 论文解读块模板 -->"
+INSERT_MARKER = "<!-- INSERT_ARTICLES_HERE -->"
+TLDR_MARKER = "[GLOBAL_TLDR_SUMMARY]"
+# chinese summary of a paper the summarizer produced none for
+MISSING_SUMMARY = "暂无简析 (No summary available)"
+
+
+class NewsLetterGenerator:
+    def __init__(
+        self,
+        time_stamp: str,
+        template_file_path: str = "./mail/email_template.html",
+        output_dir: str = "./materials",
+    ):
+        # several configs
+        self.time_stamp = time_stamp
+        self.template_file_path = template_file_path
+        self.output_dir = output_dir
+        self.global_config = {
+            "PaperPulse: Your Daily Latest Paper Acquisition Assistant": f"PaperPulse for {self.time_stamp}: Your Daily Latest Paper Acquisition Assistant",
+            "📅 Date: XXXX-XX-XX": f"📅 Date: {self.time_stamp}",
+        }
+        # matches any of the global config keys and the tldr marker, so they are replaced in one pass
+        self.global_config_pattern = re.compile(
+            "|".join(map(re.escape, [*self.global_config, TLDR_MARKER]))
+        )
+
+        # write and create some files
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not os.path.exists(self.template_file_path):
+            print(
+                f"Error! The template mailing file path: {self.template_file_path} doesn't exists."
+            )
+
+    def generate_article_html(
+        self,
+        inline_divs: bool = False,
+        article_blocks: Optional[Iterable[str]] = None,
+        l1_summary: Optional[str] = None,
+    ):
+        """
+        Renders the daily newsletter into <output_dir>/<time_stamp>.html.
+
+        Args:
+            inline_divs (bool): Emit "<div>" instead of every newline, which is the
+                                form the mail body is sent in, so the saved file
+                                can be sent as is.
+            article_blocks (Iterable[str], optional): Article blocks already rendered
+                                with render_article. Together with l1_summary it
+                                lets a caller that traverses the report data anyway
+                                skip reading the daily JSON file again.
+            l1_summary (str, optional): The global TL;DR summary.
+
+        Raises:
+            OSError: If the template cannot be read or the html cannot be written.
+            ValueError: If the template has no article placeholder.
+        """
+        with open(self.template_file_path, "r", encoding="utf-8") as f:
+            template_content = f.read()
+
+        if article_blocks is None or l1_summary is None:
+            target_json_file = os.path.join(self.output_dir, f"{self.time_stamp}.json")
+            with open(target_json_file, "r", encoding="utf-8") as file:
+                file_data = json.load(file)
+                paper_data = file_data["huggingface_papers"]
+                l2_summary_data = file_data["L2 Summary"]
+                l1_summary = file_data["L1 Summary"]
+
+            # every paper gets its block, those without a summary a placeholder
+            if len(l2_summary_data) != len(paper_data):
+                print(
+                    f"Warning: {len(paper_data)} papers but {len(l2_summary_data)} L2 summaries "
+                    f"in {target_json_file}, papers without one get a placeholder"
+                )
+            summaries = itertools.chain(l2_summary_data, itertools.repeat(MISSING_SUMMARY))
+
+            # the progress bar is only worth drawing for interactive runs
+            article_blocks = (
+                self.render_article(paper_info, summary_cn)
+                for paper_info, summary_cn in tqdm(
+                    zip(paper_data, summaries),
+                    total=len(paper_data),
+                    disable=not sys.stdout.isatty(),
+                )
+            )
+        html_insert_content = "".join(article_blocks)
+
+        # split the template once around the article block placeholder
+        head, found, rest = template_content.partition(START_MARKER)
+        if found and END_MARKER in rest:
+            tail = rest.split(END_MARKER, 1)[1]
+        else:
+            head, found, tail = template_content.partition(INSERT_MARKER)
+            if not found:
+                # raise rather than leave a stale html file behind to be mailed
+                raise ValueError(
+                    f"No article placeholder in template {self.template_file_path}"
+                )
+
+        # replace global configs and tldr in the template parts only
+        replacements = {**self.global_config, TLDR_MARKER: l1_summary}
+
+        def replace(match):
+            return replacements[match.group(0)]
+
+        parts = (
+            self.global_config_pattern.sub(replace, head),
+            html_insert_content,
+            self.global_config_pattern.sub(replace, tail),
+        )
+        buffer = io.StringIO()
+        for part in parts:
+            buffer.write(part.replace("\n", "<div>") if inline_divs else part)
+        final_html = buffer.getvalue()
+
+        save_path = os.path.join(self.output_dir, f"{self.time_stamp}.html")
+        with open(save_path, "w", encoding="utf-8") as f:
+            f.write(final_html)
+
+    def render_article(self, paper_info: dict, summary_cn: str) -> str:
+        """
+        Renders the article block of one paper record and its chinese summary.
+        """
+        return self.simple_format(
+            title=paper_info["Title"],
+            abstract_en=paper_info["Summary"],
+            summary_cn=summary_cn,
+            link=paper_info["PDF_Link"],
+        )
+
+    def simple_format(self, title: str, abstract_en: str, summary_cn: str, link: str):
+        return ARTICLE_BLOCK_TEMPLATE.render(
             title=title,
             abstract_en=abstract_en,
             summary_cn=summary_cn,
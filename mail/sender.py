@@ -2,9 +2,13 @@
 import sys
 import smtplib
 import os
-import json
 import subprocess
 import mimetypes
+import functools
+import base64
+import mmap
+import shlex
+import ssl
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.getcwd())
@@ -12,16 +16,138 @@ sys.path.append(os.getcwd())
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
-from email import encoders
 from email_validator import validate_email, EmailNotValidError
-from typing import Optional, List, Tuple
+from typing import Mapping, Optional, List, Tuple
 from pathlib import Path
+from utils.config import CONFIG_PATH, get_config
 from utils.log import setup_logging_config
 
 
 logger = setup_logging_config()
 
+# 57 input bytes encode to one 76-char base64 line (RFC 2045), so chunks of
+# whole lines can be encoded independently and concatenated
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
 
+# Socket timeout for SMTP connections, in seconds
+SMTP_TIMEOUT = 30
+
+# load the system type maps once at import, not lazily on the first attachment
+mimetypes.init()
+
+
+@functools.lru_cache(maxsize=256)
+def _guess_mime_type(extension: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Guesses the MIME type and encoding for a file extension. Cached per extension.
+    """
+    return mimetypes.guess_type("x" + extension)
+
+
+class AdbSession:
+    """
+    A persistent `adb shell` process reused for several file transfers.
+
+    Every `adb pull` starts a new adb client and sets up the device transport
+    again; this keeps one shell open instead and streams each file back as
+    base64 on its stdout, delimited by an end marker carrying the exit status.
+    Directories cannot be streamed that way and are copied with `adb pull`.
+
+    Usage:
+        with AdbSession() as session:
+            session.pull("/sdcard/Documents/my_file.txt", Path("my_file.txt"))
+    """
+
+    # never part of base64 output, so they cannot show up inside a file
+    EOF_MARKER = b"__EOF__"
+    DIR_MARKER = b"__DIR__"
+
+    def __init__(self):
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            ["adb", "shell"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Ends the shell by closing its stdin, killing it if it does not exit.
+        """
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def pull(self, device_file_path: str, local_file_path: Path) -> bool:
+        """
+        Copies one file or directory from the device.
+
+        Args:
+            device_file_path (str): Full path of the file or directory on the Android device.
+            local_file_path (Path): Where to write it on the local computer.
+
+        Returns:
+            bool: True if it was copied, False if the device could not read it.
+
+        Raises:
+            ConnectionError: If the shell exited before answering.
+        """
+        quoted_path = shlex.quote(device_file_path)
+        command = (
+            f"if [ -d {quoted_path} ]; then echo {self.DIR_MARKER.decode()}; "
+            f"else base64 {quoted_path}; echo {self.EOF_MARKER.decode()} $?; fi\n"
+        )
+        self.process.stdin.write(command.encode("utf-8"))
+        self.process.stdin.flush()
+
+        encoded_lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise ConnectionError("adb shell exited unexpectedly")
+            if line.startswith(self.DIR_MARKER):
+                return self._pull_directory(device_file_path, local_file_path)
+            if line.startswith(self.EOF_MARKER):
+                exit_status = line.split()[-1]
+                break
+            encoded_lines.append(line)
+
+        if exit_status != b"0":
+            return False
+        # b64decode drops the line breaks (and any \r added by the device)
+        with open(local_file_path, "wb") as file:
+            file.write(base64.b64decode(b"".join(encoded_lines)))
+        return True
+
+    def _pull_directory(self, device_dir_path: str, local_dir_path: Path) -> bool:
+        """
+        Copies a directory from the device with a separate `adb pull`.
+
+        adb creates the directory under the parent of local_dir_path, named after
+        the device directory, like the single-file pull did before.
+        """
+        result = subprocess.run(
+            ["adb", "pull", device_dir_path, str(local_dir_path.parent)],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            logger.debug("ADB stderr: %s", result.stderr.strip())
+            return False
+        return local_dir_path.exists()
 
 
 # feat: add adb pull command for pulling files into local for email.
@@ -33,73 +159,69 @@ def pull_file_from_android(
     Use the ADB pull command to pull files from an Android device to local.
 
     Args:
-        device_file_path (str): Full path of the file on the Android device (e.g. /sdcard/Documents/my_file.txt).
+        device_file_path (str): Full path of the file or directory on the Android device (e.g. /sdcard/Documents/my_file.txt).
         local_destination_dir (Path | str | None): Target directory to store the file on the local computer.
                                                    If None, defaults to 'api_task/log/android_file' under the current working directory.
 
     Returns:
         Path | None: If successful, returns the full Path object of the pulled local file; otherwise returns None.
     """
+    pulled = pull_files_from_android([device_file_path], local_destination_dir)
+    return pulled[0] if pulled else None
+
+
+def pull_files_from_android(
+    device_file_paths: List[str],
+    local_destination_dir: Path | str | None = None,
+) -> List[Path]:
+    """
+    Pull several files from an Android device to local over one ADB shell.
+
+    The files are streamed through a single AdbSession, so the adb client is
+    started and the device transport is set up once for the whole batch.
+
+    Args:
+        device_file_paths (List[str]): Full paths of the files on the Android device.
+        local_destination_dir (Path | str | None): Target directory to store the files on the local computer.
+                                                   If None, defaults to 'api_task/log/android_file' under the current working directory.
+
+    Returns:
+        List[Path]: The local paths of the files that were pulled, in the order of device_file_paths.
+    """
     # Handle default value and type for local_destination_dir
     if local_destination_dir is None:
         local_destination_dir = Path.cwd() / "api_task" / "log" / "android_file"
     elif isinstance(local_destination_dir, str):
         local_destination_dir = Path(local_destination_dir)
 
+    if not device_file_paths:
+        return []
+
     try:
         os.makedirs(local_destination_dir, exist_ok=True)
-        logger.info(f"Created local destination directory: {local_destination_dir}")
+        logger.info("Created local destination directory: %s", local_destination_dir)
     except OSError as e:
         logger.error(
-            f"Failed to create local destination directory {local_destination_dir}: {e}"
+            "Failed to create local destination directory %s: %s", local_destination_dir, e
         )
-        return None
-
-    file_name = Path(device_file_path).name
-    pulled_local_path = local_destination_dir / file_name  # Compose the full local path
-
-    # Build the ADB pull command
-    # Note: If the target path of adb pull is a directory, it will create a file with the same name in that directory
-    command = [
-        "adb",
-        "pull",
-        device_file_path,
-        str(local_destination_dir),
-    ]  # Convert Path object to string for subprocess
-    logger.info(f"Attempting to pull file: {' '.join(command)}")
+        return []
 
+    pulled_local_paths = []
     try:
-        result = subprocess.run(
-            command,
-            check=True,  # Raises CalledProcessError if the command returns a non-zero exit code
-            capture_output=True,  # Capture stdout and stderr
-            text=True,  # Decode output as text
-        )
-
-        # Verify if the file was actually pulled to local
-        if pulled_local_path.exists():
-            logger.info(
-                f"Successfully pulled {device_file_path} to {pulled_local_path}"
-            )
-            logger.debug(f"ADB stdout: {result.stdout.strip()}")
-            logger.debug(f"ADB stderr: {result.stderr.strip()}")
-            return pulled_local_path
-        else:
-            logger.error(
-                f"Failed to pull file {device_file_path}. Local file not found at {pulled_local_path} after pull."
-            )
-            logger.debug(f"ADB stdout: {result.stdout.strip()}")
-            logger.debug(f"ADB stderr: {result.stderr.strip()}")
-            return None
-    except subprocess.CalledProcessError as e:
-        logger.error(
-            f"Failed to pull file {device_file_path}. ADB Error: {e.stderr.strip()}"
-        )
-        logger.debug(f"ADB stdout: {e.stdout.strip()}")
-        return None
+        # one adb shell serves the whole batch, instead of one adb client per file
+        with AdbSession() as session:
+            for device_file_path in device_file_paths:
+                pulled_local_path = local_destination_dir / Path(device_file_path).name
+                if session.pull(device_file_path, pulled_local_path):
+                    logger.info(
+                        "Successfully pulled %s to %s", device_file_path, pulled_local_path
+                    )
+                    pulled_local_paths.append(pulled_local_path)
+                else:
+                    logger.error("Failed to pull file %s.", device_file_path)
     except Exception as e:
-        logger.error(f"An unexpected error occurred during file pull: {e}")
-        return None
+        logger.error("An unexpected error occurred during file pull: %s", e)
+    return pulled_local_paths
 
 
 class EmailSender:
@@ -112,22 +234,42 @@ class EmailSender:
         sender_password (str): Sender's email password.
         smtp_server (str): SMTP server address.
         smtp_port (int): SMTP server port.
+        starttls (bool): Upgrade a plain connection with STARTTLS instead of
+                         connecting with SMTP_SSL.
     """
 
-    def __init__(self, email_config_path: str):
+    def __init__(
+        self, email_config_path: str = CONFIG_PATH, config: Optional[Mapping] = None
+    ):
         """
         Initialize the EmailSender by loading configuration from a JSON file.
 
         Args:
             email_config_path (str): Path to the JSON config file.
+            config (Optional[Mapping]): An already parsed config, used instead of
+                                        reading email_config_path.
+
+        Raises:
+            ValueError: If the configured sender email is not valid.
         """
         self.email_config_path = email_config_path
-        with open(self.email_config_path, "r") as file:
-            self.config_data = json.load(file)
+        self.config_data = (
+            get_config(self.email_config_path) if config is None else config
+        )
         self.sender_email, self.sender_password = self._get_usr_config()
         self.smtp_server, self.smtp_port = self._get_smtp_config()
+        # SMTP_SSL unless the config explicitly asks for STARTTLS
+        self.starttls = bool(self.config_data.get("starttls", False))
         self.logger = setup_logging_config()
 
+        # Validate sender email once, it is the same for every message
+        try:
+            validate_email(self.sender_email, check_deliverability=False)
+        except EmailNotValidError as e:
+            raise ValueError(
+                f"Sender email '{self.sender_email}' is not valid: {e}"
+            ) from e
+
     def _get_usr_config(self) -> Tuple[str, str]:
         return str(self.config_data["sender_email"]).strip(), str(self.config_data["sender_password"]).strip()
 
@@ -142,42 +284,54 @@ class EmailSender:
             msg (MIMEMultipart): The email message object.
             file_path (str): Path to the file to attach.
         """
-        if os.path.exists(file_path):
-            try:
-                # Try to get MIME type based on file extension
-                ctype, encoding = mimetypes.guess_type(file_path)
-                if ctype is None or encoding is not None:
-                    # Fallback to generic type if unable to guess or encoding exists
-                    ctype = "application/octet-stream"
-
-                maintype, subtype = ctype.split("/", 1)
-
-                with open(file_path, "rb") as attachment:
-                    part2 = MIMEBase(maintype, subtype)
-                    part2.set_payload(attachment.read())
-
-                encoders.encode_base64(part2)
-
-                filename = os.path.basename(file_path)
-                part2.add_header(
-                    "Content-Disposition",
-                    f"attachment; filename*=utf-8''{filename}",
-                )
-                part2.add_header(
-                    "Content-Disposition", f"attachment; filename*=utf-8''{filename}"
-                )
-                # # Note: If the filename contains non-ASCII characters, there may be garbled text or replacements here
-                # part2.add_header(
-                #     "Content-Disposition",
-                #     f"attachment; filename=\"{filename}\"" # Use double quotes to enclose the filename
-                # )
-                msg.attach(part2)
-            except Exception as e:
-                self.logger.warning(f"Could not attach file {file_path}: {e}")
-        else:
+        try:
+            # Try to get MIME type based on file extension
+            ctype, encoding = _guess_mime_type(os.path.splitext(file_path)[1])
+            if ctype is None or encoding is not None:
+                # Fallback to generic type if unable to guess or encoding exists
+                ctype = "application/octet-stream"
+
+            maintype, subtype = ctype.split("/", 1)
+
+            # Encode the memory-mapped file chunk by chunk into a buffer of the
+            # exact output size, instead of reading it whole and encoding a copy
+            with open(file_path, "rb") as attachment:
+                size = os.fstat(attachment.fileno()).st_size
+                encoded = bytearray(((size + 2) // 3) * 4 + (size + 56) // 57)
+                if size:
+                    with mmap.mmap(
+                        attachment.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as data:
+                        offset = 0
+                        for start in range(0, size, ATTACHMENT_CHUNK_SIZE):
+                            chunk = base64.encodebytes(
+                                data[start : start + ATTACHMENT_CHUNK_SIZE]
+                            )
+                            encoded[offset : offset + len(chunk)] = chunk
+                            offset += len(chunk)
+
+            part2 = MIMEBase(maintype, subtype)
+            part2.set_payload(encoded.decode("ascii"))
+            part2["Content-Transfer-Encoding"] = "base64"
+
+            filename = os.path.basename(file_path)
+            # the stdlib encodes the filename per RFC 2231, also for non-ASCII names
+            part2.add_header(
+                "Content-Disposition", "attachment", filename=("utf-8", "", filename)
+            )
+            # # Note: If the filename contains non-ASCII characters, there may be garbled text or replacements here
+            # part2.add_header(
+            #     "Content-Disposition",
+            #     f"attachment; filename=\"{filename}\"" # Use double quotes to enclose the filename
+            # )
+            msg.attach(part2)
+        except FileNotFoundError:
             self.logger.warning(
-                f"Warning: Attachment file not found at {file_path}. Skipping this attachment."
+                "Warning: Attachment file not found at %s. Skipping this attachment.",
+                file_path,
             )
+        except Exception as e:
+            self.logger.warning("Could not attach file %s: %s", file_path, e)
 
     def send_mail(
         self,
@@ -203,17 +357,40 @@ class EmailSender:
             smtplib.SMTPAuthenticationError: If authentication fails.
             Exception: For other errors during sending.
         """
-        # Validate sender email
-        try:
-            validate_email(self.sender_email, check_deliverability=False)
-        except EmailNotValidError as e:
-            self.logger.error(f"Sender email '{self.sender_email}' is not valid: {e}")
-            return
+        self.send_batch(
+            [receiver_email],
+            subject=subject,
+            body=body,
+            attach_local_file_path=attach_local_file_path,
+            attach_android_file_path=attach_android_file_path,
+            retries=retries,
+        )
+
+    def build_message(
+        self,
+        subject: str = "hello world",
+        body: str = "hello world, just for fun!",
+        attach_local_file_path: Optional[str | List[str]] = None,
+        attach_android_file_path: Optional[str | List[str]] = None,
+    ) -> MIMEMultipart:
+        """
+        Build an email with optional attachments, without a recipient.
 
+        Attachments are read and encoded here once, so the returned message can
+        be delivered to any number of recipients.
+
+        Args:
+            subject (str): Email subject.
+            body (str): Email body (plain text).
+            attach_local_file_path (Optional[str | List[str]]): Path(s) to local files to attach.
+            attach_android_file_path (Optional[str | List[str]]): Path(s) to Android device files to attach.
+
+        Returns:
+            MIMEMultipart: The email message object.
+        """
         # --- Create the email ---
         msg = MIMEMultipart()
         msg["From"] = f"<{self.sender_email}>"
-        msg["To"] = receiver_email
         msg["Subject"] = subject
         msg.attach(MIMEText(body, "plain", "utf-8"))
         msg.add_header("Content-Type", 'multipart/mixed; charset="utf-8"')
@@ -223,13 +400,10 @@ class EmailSender:
         if attach_android_file_path is not None:
             if isinstance(attach_android_file_path, str):
                 attach_android_file_path = [attach_android_file_path]
-            # all transfer into local devices
-            new_path = [
-                str(pull_file_from_android(device_file_path=an_file_path))
-                for an_file_path in attach_android_file_path
-            ]
+            # all transfer into local devices, with one adb invocation
+            new_path = pull_files_from_android(attach_android_file_path)
             for file_path_n in new_path:
-                self._attach_file(msg, file_path_n)
+                self._attach_file(msg, str(file_path_n))
 
         if attach_local_file_path is not None:
             if isinstance(attach_local_file_path, str):
@@ -237,23 +411,148 @@ class EmailSender:
             for file_path in attach_local_file_path:
                 self._attach_file(msg, file_path)
 
+        return msg
+
+    def _connect(self) -> smtplib.SMTP:
+        """
+        Open an encrypted connection to the configured SMTP server.
+
+        Uses SMTP_SSL by default; with "starttls" set in the config a plain
+        connection is upgraded with STARTTLS instead. The EHLO afterwards lets smtplib see the server's extensions.
+
+        Returns:
+            smtplib.SMTP: The connected, not yet logged-in SMTP connection.
+        """
+        context = ssl.create_default_context()
+        if self.starttls:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=SMTP_TIMEOUT)
+            server.starttls(context=context)
+        else:
+            server = smtplib.SMTP_SSL(
+                self.smtp_server, self.smtp_port, timeout=SMTP_TIMEOUT, context=context
+            )
+        server.ehlo()
+        return server
+
+    def deliver(
+        self,
+        msg: MIMEMultipart,
+        receiver_emails: List[str],
+        server: smtplib.SMTP,
+        bcc: bool = False,
+    ):
+        """
+        Deliver a built message to several recipients over a logged-in connection.
+
+        Each delivered recipient is removed from the front of receiver_emails,
+        so after a failure the list holds exactly the recipients left to retry.
+        A recipient the server refuses is logged and dropped as well, so it
+        neither stops the others nor causes a retry.
+
+        Args:
+            msg (MIMEMultipart): The email message object from build_message.
+            receiver_emails (List[str]): Recipients' email addresses, consumed in place.
+            server (smtplib.SMTP): The logged-in SMTP connection.
+            bcc (bool): Send one message to all recipients in a single SMTP
+                        transaction, without listing them in the To header.
+        """
+        if bcc and receiver_emails:
+            del msg["To"]
+            msg["To"] = "undisclosed-recipients:;"
+            try:
+                refused = server.send_message(msg, to_addrs=receiver_emails)
+            except smtplib.SMTPRecipientsRefused as e:
+                # raised only when every recipient was refused
+                refused = e.recipients
+            for receiver_email, error in refused.items():
+                self.logger.error("Recipient %s refused: %s", receiver_email, error)
+            self.logger.info(
+                "Message sent from %s to %d recipients",
+                self.sender_email,
+                len(receiver_emails) - len(refused),
+            )
+            receiver_emails.clear()
+            return
+
+        while receiver_emails:
+            receiver_email = receiver_emails[0]
+            del msg["To"]
+            msg["To"] = receiver_email
+            try:
+                server.send_message(msg)
+            except smtplib.SMTPRecipientsRefused as e:
+                receiver_emails.pop(0)
+                self.logger.error(
+                    "Recipient %s refused: %s", receiver_email, e.recipients.get(receiver_email)
+                )
+                continue
+            receiver_emails.pop(0)
+            self.logger.info(
+                "Message sent from %s to %s", self.sender_email, receiver_email
+            )
+
+    def send_batch(
+        self,
+        receiver_emails: List[str],
+        subject: str = "hello world",
+        body: str = "hello world, just for fun!",
+        attach_local_file_path: Optional[str | List[str]] = None,
+        attach_android_file_path: Optional[str | List[str]] = None,
+        retries = 5,
+        bcc: bool = False,
+    ):
+        """
+        Send the same email to several recipients over a single SMTP connection.
+
+        The message and its attachments are built once, and the TLS handshake
+        and login happen once per connection instead of once per recipient.
+
+        Args:
+            receiver_emails (List[str]): Recipients' email addresses.
+            subject (str): Email subject.
+            body (str): Email body (plain text).
+            attach_local_file_path (Optional[str | List[str]]): Path(s) to local files to attach.
+            attach_android_file_path (Optional[str | List[str]]): Path(s) to Android device files to attach.
+            retries (int): Number of connection attempts. Only connection
+                           problems and temporary (4xx) server errors are retried.
+            bcc (bool): Deliver to all recipients in one SMTP transaction, hiding
+                        them from each other, instead of one message each.
+        """
+        msg = self.build_message(
+            subject=subject,
+            body=body,
+            attach_local_file_path=attach_local_file_path,
+            attach_android_file_path=attach_android_file_path,
+        )
+
         # --- Send the email ---
+        # recipients already delivered are not sent again when a retry reconnects
+        pending = list(receiver_emails)
         for index in range(retries):
             try:
                 print(f"Retries in {index}")
-                with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as server:
+                with self._connect() as server:
                     server.login(self.sender_email, self.sender_password)
-                    server.send_message(msg)
+                    self.deliver(msg, pending, server, bcc=bcc)
                 self.logger.info("Email sent successfully!")
-                self.logger.info(
-                    f"Message sent from {self.sender_email} to {receiver_email}"
-                )
                 return
             except smtplib.SMTPAuthenticationError:
                 self.logger.error("Failed to send email!")
                 self.logger.error(
                     "Authentication failed: Please check if the sender email address and password/authorization code are correct."
                 )
+                return
+            except smtplib.SMTPResponseException as e:
+                self.logger.error("Failed to send email!")
+                self.logger.error("An error occurred: %s", e)
+                # a permanent (5xx) answer would be the same on the next attempt
+                if not 400 <= e.smtp_code < 500:
+                    return
+            except (smtplib.SMTPException, OSError) as e:
+                # connection problems, worth reconnecting for
+                self.logger.error("Failed to send email!")
+                self.logger.error("An error occurred: %s", e)
             except Exception as e:
                 self.logger.error("Failed to send email!")
-                self.logger.error(f"An error occurred: {e}")
+                self.logger.error("An error occurred: %s", e)
+                return
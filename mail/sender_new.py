@@ -1,25 +1,74 @@
 # Add two API modules: Bilibili-related video operations and automatic email sending assistant
 import sys
 import os
-import json
-import requests
+import asyncio
+import aiohttp
 import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.getcwd())
 
-from typing import List
-from tqdm import tqdm
+from typing import List, Mapping, Optional
+from tqdm.asyncio import tqdm_asyncio
+from utils.config import CONFIG_PATH, get_config
 from utils.log import setup_logging_config
+from utils.session import create_session
+
+# Number of GeekSend requests in flight at once
+MAX_CONCURRENT_SENDS = 4
+# Upper bound of pooled connections to the GeekSend API
+MAX_CONNECTIONS = 16
+# Sustained GeekSend request rate, shared by all workers; the one request per
+# second the sender always kept to, "send_rate_per_second" in the config overrides it
+SEND_RATE_PER_SECOND = 1.0
+# Attempts per mail when GeekSend is unreachable, rate limits (429) or fails (5xx)
+SEND_ATTEMPTS = 3
+# Seconds to wait before the first retry of a mail, doubled on every further one
+RETRY_BACKOFF_SECONDS = 2
+# "code" values of a GeekSend response body that mean the mail was accepted
+SUCCESS_CODES = (0, 200)
+# Access token lifetime assumed when the OAuth response carries no expires_in
+DEFAULT_TOKEN_TTL_SECONDS = 3600
+# Refresh the access token this long before it actually expires
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+
+class LeakyBucket:
+    """
+    An asyncio leaky-bucket limiter spacing outgoing API calls evenly.
+
+    A call only waits for whatever is left of the 1 / rate interval since the
+    previous one, so slow requests are not delayed any further.
+    It must be created inside the event loop that uses it.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.last_ts = float("-inf")
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until the next call is allowed.
+        """
+        async with self.lock:
+            wait = self.interval - (time.monotonic() - self.last_ts)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_ts = time.monotonic()
 
 
 class EmailSender:
-    def __init__(self, email_config_path: str):
+    def __init__(
+        self, email_config_path: str = CONFIG_PATH, config: Optional[Mapping] = None
+    ):
         # get secret_id and api_key
         # for this class, we use GeekSeed for its efficiency
         self.email_config_path = email_config_path
-        with open(self.email_config_path, "r", encoding="utf-8") as file:
-            self.config_data = json.load(file)
+        # the parsed config is shared, read it from the path only when none is given
+        self.config_data = (
+            get_config(self.email_config_path) if config is None else config
+        )
 
         # get several config
         self.sender_mail = self._get_config("sender_mail")
@@ -27,36 +76,84 @@ class EmailSender:
         self.client_secret = self._get_config("client_secret")
         self.template_id = self._get_config("template_id")
         self.default_mail_lists = self._get_config("recipient email list")
+        self.send_rate = float(
+            self.config_data.get("send_rate_per_second", SEND_RATE_PER_SECOND)
+        )
         self.logger = setup_logging_config()
-        self.token = self._get_access_token()
+        # keep-alive session, so every request after the first skips the TLS handshake
+        self.session = create_session()
+        self.token, self._token_exp = self._get_access_token()
 
     def _get_config(self, config_name: str):
         return self.config_data[config_name]
 
     def _get_access_token(self):
+        """
+        Requests a new access token.
+
+        Returns:
+            tuple[str, float]: The token and the time.monotonic() deadline after
+                               which it should be refreshed.
+        """
         params = {
             "grant_type": "client_credentials",
             "client_id": self.client_id,
             "client_secret": self.client_secret,
         }
 
-        res = requests.post("https://open.geeksend.com/oauth/access_token", data=params)
-        token = res.json()["data"]["access_token"]
-        return token
+        res = self.session.post("https://open.geeksend.com/oauth/access_token", data=params)
+        data = res.json()["data"]
+        expires_in = data.get("expires_in", DEFAULT_TOKEN_TTL_SECONDS)
+        token_exp = time.monotonic() + expires_in - TOKEN_REFRESH_MARGIN_SECONDS
+        return data["access_token"], token_exp
+
+    def _get_token(self) -> str:
+        """
+        Returns the cached access token, refreshing it shortly before it expires.
+        """
+        if time.monotonic() > self._token_exp:
+            self.token, self._token_exp = self._get_access_token()
+        return self.token
+
+    @staticmethod
+    def _response_error(status: Optional[int], payload) -> Optional[str]:
+        """
+        Returns why a send request failed, or None if the mail was accepted.
 
-    def send(
+        Args:
+            status (Optional[int]): The HTTP status, None if no response arrived.
+            payload: The decoded response body, or the error of a failed request.
+        """
+        if status is None:
+            return f"request failed: {payload}"
+        if not 200 <= status < 300:
+            return f"HTTP {status}: {payload}"
+        if not isinstance(payload, dict):
+            return f"unexpected response: {payload}"
+        code = payload.get("code", 0)
+        if code not in SUCCESS_CODES:
+            return f"error code {code}: {payload.get('msg', payload)}"
+        return None
+
+    async def send(
         self,
         mail_lists: List[str] = None,
         subject: str = "PaperPulse: Your Daily Latest Paper Acquisition Assistant",
         body: str = "Maybe something is wrong? Contact the author: yangxiyuan@sjtu.edu.cn",
-    ):
+    ) -> List[str]:
+        """
+        Sends the mail to every recipient, retrying the requests GeekSend did not
+        process (no response, 429 or 5xx).
+
+        Returns:
+            List[str]: The recipients the mail could not be sent to.
+        """
         if mail_lists is None:
             # get default settings
             mail_lists = self.default_mail_lists
 
         if not isinstance(mail_lists, list):
             mail_lists = [mail_lists]
-        all_response = []
         mail_length = len(mail_lists)
 
         # # wrap with html
@@ -65,22 +162,73 @@ class EmailSender:
         # body_new = "<p>" + body_new + "</p>"
         
 
-        for mail in tqdm(mail_lists, total=mail_length):
-            headers = {"Authorization": f"Bearer {self.token}"}
-            params = {
-                "emails": [mail],
-                "prospect_id": 0,
-                "template_id": self.template_id,
-                "subject": subject,
-                "content": body,
-                "sender": self.sender_mail,
-                "reply_email": self.sender_mail,
-            }
-            # sleeping for one seconds
-            time.sleep(1)
-            res = requests.post(
-                "https://open.geeksend.com/send/email", headers=headers, data=params
-            ).json()
-            all_response.append(res)
-
-        print(f"Result: {json.dumps(all_response,indent=2,ensure_ascii=False)}")
+        rate_limiter = LeakyBucket(self.send_rate)
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+        # the token is read per request, a batch may outlive the one it started
+        # with; the lock keeps concurrent workers from refreshing it twice
+        token_lock = asyncio.Lock()
+        # everything but the recipient and the token is the same for every mail
+        base_params = {
+            "prospect_id": 0,
+            "template_id": self.template_id,
+            "subject": subject,
+            "content": body,
+            "sender": self.sender_mail,
+            "reply_email": self.sender_mail,
+        }
+
+        async def send_one(session: aiohttp.ClientSession, mail: str) -> Optional[str]:
+            """
+            Sends the mail to one recipient, returns why it failed or None.
+            """
+            params = {**base_params, "emails": [mail]}
+            async with semaphore:
+                for attempt in range(SEND_ATTEMPTS):
+                    if attempt:
+                        await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                    # wait for the shared rate limit instead of sleeping one second per mail
+                    await rate_limiter.acquire()
+                    # a refresh is a blocking requests call, keep it off the event loop
+                    async with token_lock:
+                        token = await asyncio.to_thread(self._get_token)
+                    headers = {"Authorization": f"Bearer {token}"}
+                    try:
+                        async with session.post(
+                            "https://open.geeksend.com/send/email", headers=headers, data=params
+                        ) as response:
+                            status = response.status
+                            try:
+                                payload = await response.json(content_type=None)
+                            except ValueError:
+                                payload = await response.text()
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        status, payload = None, e
+                    self.logger.debug("GeekSend response for %s: %s %s", mail, status, payload)
+
+                    error = self._response_error(status, payload)
+                    if error is None or not (status is None or status == 429 or status >= 500):
+                        return error
+                    if attempt + 1 < SEND_ATTEMPTS:
+                        self.logger.warning(
+                            "Sending to %s failed (%s), attempt %d of %d",
+                            mail, error, attempt + 1, SEND_ATTEMPTS,
+                        )
+                return error
+
+        # errors keep the order of mail_lists
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            errors = await tqdm_asyncio.gather(
+                *[send_one(session, mail) for mail in mail_lists], total=mail_length
+            )
+
+        failed = []
+        for mail, error in zip(mail_lists, errors):
+            if error is not None:
+                self.logger.error("Could not send mail to %s: %s", mail, error)
+                failed.append(mail)
+        print(f"Result: sent {mail_length - len(failed)} of {mail_length} mails")
+        if failed:
+            print(f"Failed recipients: {', '.join(failed)}")
+        return failed
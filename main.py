@@ -1,22 +1,54 @@
+import asyncio
 import os
 import sys
-import json
 import dotenv
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import ijson
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from datetime import datetime
 
 sys.path.append(os.getcwd())
 
-from crawler.paper import HuggingFacePaperScraper
-from crawler.gh_trending import GithubTrendingScraper
-from mail.sender_new import EmailSender
-from mail.generate_news_letter import NewsLetterGenerator
-from summary.ai import AISummarizer
+from utils.config import CONFIG_PATH, get_config
 
-EMAIL_CONFIG_PATH = "./mail/config.json"
+# date of this run, computed once for every component of the report
+TIME_STAMP = datetime.now().strftime("%Y%m%d")
+# markdown blocks of the report, one formatted call per record
+_REPO_TPL = "### Repo: {short_url}\n\nurl: {url}\n\nlanguage: {language}\n\n\n{description}\n\n\n".format_map
+_PAPER_TPL = "### Paper: {title}\n\nurl: {url}\n\n\n{summary}\n\n\n".format_map
+# write buffer of the markdown report
+MARKDOWN_BUFFER_SIZE = 1 << 20
 dotenv.load_dotenv()
 
 
+def _format_repo(content: dict) -> str:
+    """
+    Formats one trending repository as a markdown block.
+    """
+    url = content.get("url", "")
+    return _REPO_TPL(
+        {
+            # strip the "https://github.com/" prefix
+            "short_url": url[19:],
+            "url": url,
+            "language": content.get("language", "N/A"),
+            "description": content.get("description", ""),
+        }
+    )
+
+
+def _format_paper(content: dict) -> str:
+    """
+    Formats one trending paper as a markdown block.
+    """
+    return _PAPER_TPL(
+        {
+            "title": content.get("Title", "N/A"),
+            "url": content.get("PDF_Link", ""),
+            "summary": content.get("Summary", ""),
+        }
+    )
+
+
 class AIReporter:
     """
     A class to automate the process of crawling, summarizing, and reporting
@@ -27,9 +59,7 @@ class AIReporter:
         """
         Initializes the AIReporter with necessary scraper and sender objects.
         """
-        self.time_stamp = (
-            datetime.now().strftime("%Y%m%d") if time_stamp is None else time_stamp
-        )
+        self.time_stamp = TIME_STAMP if time_stamp is None else time_stamp
         self.materials_dir = "./materials"
         self.json_file_path = os.path.join(
             self.materials_dir, f"{self.time_stamp}.json"
@@ -41,14 +71,13 @@ class AIReporter:
             self.materials_dir, f"{self.time_stamp}.html"
         )
 
-        # Initialize the tools used for the report generation
-        self.paper_scraper = HuggingFacePaperScraper()
-        self.gh_scraper = GithubTrendingScraper()
-        self.ai_summarizer = AISummarizer()
-        self.news_generator = NewsLetterGenerator(time_stamp=self.time_stamp)
-        self.mail_sender = EmailSender(email_config_path=EMAIL_CONFIG_PATH)
+        # The tools used for the report generation pull in heavy dependencies
+        # (requests, bs4, openai, jinja2, aiohttp), and the scrapers and the
+        # summarizer are only needed when the daily data does not exist yet,
+        # so every tool is imported and built on first use
+        self.news_generator = None
+        self.mail_sender = None
 
-        self.report_data = None
         self.report_body = None
 
     def _crawling(self):
@@ -57,24 +86,41 @@ class AIReporter:
         """
         print("Start Scraping")
 
-        try:
-            print("Start Scraping for Papers.")
-            self.paper_scraper.run()
-        except Exception as e:
-            print(f"Error: {e} in Papers fetching, skipping")
+        from crawler.paper import HuggingFacePaperScraper
+        from crawler.gh_trending import GithubTrendingScraper
 
-        print("Start Scraping for Github Trendings.")
-        # Setting a timeout of 10 minutes (600 seconds) for the GitHub scraper
+        # Both scrapers are network-bound and independent, so they run side by side;
+        # they merge their results into the daily JSON file under a file lock
+        # Setting a timeout of 10 minutes (600 seconds) for the scrapers
         TIMEOUT_SECONDS = 600
+        scrapers = {
+            # the scrapers write the file of this run, even if they pass midnight
+            "Papers": HuggingFacePaperScraper(time_stamp=self.time_stamp).run,
+            "Github Trendings": GithubTrendingScraper(time_stamp=self.time_stamp).run,
+        }
+        # no with-block: its shutdown(wait=True) would block on a hung scraper
+        # and make the timeout useless
+        executor = ThreadPoolExecutor(max_workers=len(scrapers))
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(self.gh_scraper.run)
-                future.result(timeout=TIMEOUT_SECONDS)
-                print("Github Trendings scraping finished successfully.")
-        except TimeoutError:
-            print(f"Time out after {TIMEOUT_SECONDS} seconds. Skipping this task.")
-        except Exception as e:
-            print(f"Error: {e} in Github Trendings, skipping")
+            futures = {}
+            for name, run in scrapers.items():
+                print(f"Start Scraping for {name}.")
+                futures[executor.submit(run)] = name
+            try:
+                for future in as_completed(futures, timeout=TIMEOUT_SECONDS):
+                    name = futures[future]
+                    try:
+                        future.result()
+                        print(f"{name} scraping finished successfully.")
+                    except Exception as e:
+                        print(f"Error: {e} in {name}, skipping")
+            except TimeoutError:
+                pending = [name for future, name in futures.items() if not future.done()]
+                print(
+                    f"Time out after {TIMEOUT_SECONDS} seconds. Skipping {', '.join(pending)}."
+                )
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
         print("Finish Scraping")
 
@@ -83,51 +129,93 @@ class AIReporter:
         Calls the AI summarizer to process the scraped data.
         """
         print("Calling AI")
-        self.ai_summarizer.run()
+        from summary.ai import AISummarizer
+
+        # summarize the file of this run, even if it started before midnight
+        AISummarizer(time_stamp=self.time_stamp).run()
         print("Calling AI Ended")
 
+    def _stream_items(self, prefix: str):
+        """
+        Yields the values under prefix in the daily JSON file, one at a time.
+
+        Only the current value is held in memory, so the peak usage follows the
+        largest single record rather than the file size.
+
+        :param prefix: The ijson prefix, e.g. "gh_trendings.item".
+        """
+        with open(self.json_file_path, "rb") as file:
+            yield from ijson.items(file, prefix, use_float=True)
+
     def _finish_report(self):
         """
-        Generates the final markdown report from the JSON data.
+        Generates the final markdown and html reports from the JSON data.
         """
         print("Generating report files")
-        # Load the data from the JSON file created by the summarizer
+        # The L1 summary is a single string, ijson stops reading once it has it
         try:
-            with open(self.json_file_path, "r", encoding="utf-8") as file:
-                self.report_data = json.load(file)
+            with open(self.json_file_path, "rb") as file:
+                self.report_body = next(ijson.items(file, "L1 Summary"), None)
         except FileNotFoundError:
             print(f"Error: JSON file not found at {self.json_file_path}")
             return False
 
-        self.report_body = self.report_data["L1 Summary"]
+        if self.report_body is None:
+            print(f"Error: No L1 Summary in {self.json_file_path}")
+            return False
+
+        from mail.generate_news_letter import MISSING_SUMMARY, NewsLetterGenerator
+
+        if self.news_generator is None:
+            self.news_generator = NewsLetterGenerator(time_stamp=self.time_stamp)
+
+        # the chinese summaries are needed by both outputs, and are small
+        l2_summaries = list(self._stream_items("L2 Summary.item"))
+        html_blocks = []
 
-        # Generate the markdown file
-        with open(self.markdown_file_path, "w", encoding="utf-8") as file:
-            file.write(f"# Welcome to {self.time_stamp} AI Report\n\n")
-            file.write(f"{self.report_body}\n\n")
-            file.write("## Introduction\n\n")
+        def paper_sections():
+            # the markdown and the html article blocks are built in the same pass
+            # over the papers, instead of the generator reading the JSON again
+            # a paper without a summary still gets its block, so the mail lists the
+            # same papers as the markdown attachment
+            for index, paper in enumerate(self._stream_items("huggingface_papers.item")):
+                if index < len(l2_summaries):
+                    summary_cn = l2_summaries[index]
+                else:
+                    print(f"Warning: No L2 summary for paper {paper.get('Title', index)}")
+                    summary_cn = MISSING_SUMMARY
+                html_blocks.append(self.news_generator.render_article(paper, summary_cn))
+                yield _format_paper(paper)
 
-            summary = self.report_data.get("L2 Summary", [])
-            for content in summary:
-                file.write(f"{content}\n\n\n")
+        # Generate the markdown file, streaming one record at a time from the JSON
+        # file; each section is handed to a 1 MiB buffered writer in one
+        # writelines call, so the small blocks reach the disk in few syscalls
+        with open(
+            self.markdown_file_path, "w", encoding="utf-8", buffering=MARKDOWN_BUFFER_SIZE
+        ) as file:
+            file.write(
+                f"# Welcome to {self.time_stamp} AI Report\n\n"
+                f"{self.report_body}\n\n"
+                "## Introduction\n\n"
+            )
+            file.writelines(f"{content}\n\n\n" for content in l2_summaries)
 
             file.write("## Repo Trendings\n\n")
-            data_gh = self.report_data.get("gh_trendings", [])
-            for content in data_gh:
-                file.write(f"### Repo: {content.get('url', '')[19:]}\n\n")
-                file.write(f"url: {content.get('url', '')}\n\n")
-                file.write(f"language: {content.get('language', 'N/A')}\n\n")
-                file.write(f"\n{content.get('description', '')}\n\n\n")
+            file.writelines(map(_format_repo, self._stream_items("gh_trendings.item")))
 
             file.write("## Paper Trendings\n\n")
-            data_paper = self.report_data.get("huggingface_papers", [])
-            for content in data_paper:
-                file.write(f"### Paper: {content.get('Title', 'N/A')}\n\n")
-                file.write(f"url: {content.get('PDF_Link', '')}\n\n")
-                file.write(f"\n{content.get('Summary', '')}\n\n\n")
-
-        # generate html file
-        self.news_generator.generate_article_html()
+            file.writelines(paper_sections())
+
+        # generate html file from the blocks rendered above
+        # the html file is only used as the mail body, so it is written in the
+        # <div>-separated form the mail is sent in
+        try:
+            self.news_generator.generate_article_html(
+                inline_divs=True, article_blocks=html_blocks, l1_summary=self.report_body
+            )
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            return False
         print("Report files generated successfully.")
         return True
 
@@ -137,21 +225,26 @@ class AIReporter:
         """
         # Load the recipient list from the config file
         try:
-            with open(EMAIL_CONFIG_PATH, "r") as file:
-                email_list = (json.load(file)).get("recipient email list")
+            email_list = get_config(CONFIG_PATH).get("recipient email list")
         except FileNotFoundError:
             print("Error: Email config file not found.")
             return
 
+        # the newsletter generator already emits <div> in place of newlines
         with open(self.html_file_path, "r", encoding="utf-8") as file:
             send_body = file.read()
 
-        send_body = send_body.replace("\n", "<div>")
+        if self.mail_sender is None:
+            from mail.sender_new import EmailSender
 
-        self.mail_sender.send(
-            email_list,
-            subject=f"PaperPulse for {self.time_stamp}: Your Daily Latest Paper Acquisition Assistant",
-            body=send_body,
+            self.mail_sender = EmailSender(email_config_path=CONFIG_PATH)
+
+        asyncio.run(
+            self.mail_sender.send(
+                email_list,
+                subject=f"PaperPulse for {self.time_stamp}: Your Daily Latest Paper Acquisition Assistant",
+                body=send_body,
+            )
         )
 
     def run_report(self):
@@ -160,12 +253,15 @@ class AIReporter:
         """
         os.makedirs(self.materials_dir, exist_ok=True)
 
-        if not os.path.exists(
-            os.path.join(self.materials_dir, f"{self.time_stamp}.json")
-        ):
-            with open(self.json_file_path, "w") as file:
-                json.dump({}, file)
+        # the scrapers and the summarizer create the JSON file through the atomic
+        # update_json, so no empty placeholder file is written up front; an empty
+        # "{}" file left by an earlier version is crawled again as well
+        try:
+            has_data = os.path.getsize(self.json_file_path) > 2
+        except FileNotFoundError:
+            has_data = False
 
+        if not has_data:
             self._crawling()
             self._get_ai_info()
 
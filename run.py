@@ -1,25 +1,27 @@
-import schedule
+import os
 import time
 import subprocess
 import datetime
 import sys
+import threading
 from tqdm import tqdm
 
 # * custom settings can be placed here
 SETTING_TIME = "21:00"
+# Seconds between two progress bar updates while waiting for the next run
+PROGRESS_UPDATE_SECONDS = 60
+# main.py is killed if a single run takes longer than this
+SCRIPT_TIMEOUT_SECONDS = 7200
 
 
-# --- Function to get time remaining (still needed for tqdm's 'total') ---
-def get_time_remaining(target_time_str):
-    """Calculates the seconds remaining until the next scheduled run."""
+def get_next_run(target_time_str):
+    """Calculates the datetime of the next scheduled run."""
     now = datetime.datetime.now()
     target_time = datetime.datetime.strptime(target_time_str, "%H:%M").time()
     next_run_dt = datetime.datetime.combine(now.date(), target_time)
     if now.time() >= target_time:
         next_run_dt += datetime.timedelta(days=1)
-
-    time_remaining = next_run_dt - now
-    return int(time_remaining.total_seconds())
+    return next_run_dt
 
 
 # --- run_script remains the same ---
@@ -34,38 +36,64 @@ def run_script():
     print(f"🤖 STARTING TASK: main.py | Time: {timestamp}")
     print("-" * 50)
 
+    # stream the output of main.py line by line instead of holding all of it in memory
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             [
                 # ! switch to your own command
                 "/data/xiyuanyang/PaperPulse/.venv/bin/python",
                 "main.py",
             ],
-            check=True,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            timeout=7200,
+            bufsize=1,
+            # a child writing to a pipe block-buffers its stdout, which would
+            # hold back the output until 8 KiB piled up or main.py exited
+            env={**os.environ, "PYTHONUNBUFFERED": "1"},
         )
-        print("✅ Success!")
-        print("\n".join(result.stdout.splitlines()))
-        print("\n\n" + "-" * 50)
+    except Exception as e:
+        print(f"❌ Critical Error: {e}")
         print("-" * 50)
+        return
+
+    # reading stdout blocks until main.py exits, so the timeout is enforced by a timer;
+    # the timer sets the flag itself, its thread may still be alive after the kill
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        proc.kill()
 
-    except subprocess.CalledProcessError as e:
-        print("❌ ERROR: Task failed with a non-zero exit code.")
-        print(f"Return Code: {e.returncode}")
-        print("Standard Error")
-        print("\n".join(e.stderr.splitlines()))
+    watchdog = threading.Timer(SCRIPT_TIMEOUT_SECONDS, kill_on_timeout)
+    watchdog.start()
+    try:
+        for line in proc.stdout:
+            sys.stdout.write(line)
+        return_code = proc.wait()
+
+        if timed_out.is_set():
+            print(f"❌ ERROR: Task timed out after {SCRIPT_TIMEOUT_SECONDS} seconds.")
+        elif return_code != 0:
+            print("❌ ERROR: Task failed with a non-zero exit code.")
+            print(f"Return Code: {return_code}")
+        else:
+            print("✅ Success!")
         print("\n\n" + "-" * 50)
+        print("-" * 50)
 
     except Exception as e:
+        proc.kill()
         print(f"❌ Critical Error: {e}")
         print("-" * 50)
 
+    finally:
+        watchdog.cancel()
+        proc.stdout.close()
+
 
 if __name__ == "__main__":
     try:
-        schedule.every().day.at(SETTING_TIME).do(run_script)
         print(f"✅ PaperPulse Scheduler started. Target time: {SETTING_TIME}")
         print("--------------------------------------------------")
 
@@ -79,16 +107,19 @@ if __name__ == "__main__":
         ) as pbar:
 
             while True:
-                schedule.run_pending()
-                seconds_remaining = get_time_remaining(SETTING_TIME)
-                seconds_elapsed_since_last_run = TOTAL_DAY_SECONDS - seconds_remaining
-
-                pbar.n = seconds_elapsed_since_last_run
+                # There is a single daily job, so sleep until its absolute start time
+                # instead of polling a scheduler; the bar is redrawn once a minute
+                next_run = get_next_run(SETTING_TIME)
                 pbar.set_description(f"Next Run at {SETTING_TIME}")
-                pbar.refresh()
-
-                # The scheduler now checks for tasks and updates the bar every 5 seconds.
-                time.sleep(1)
+                while True:
+                    seconds_remaining = (next_run - datetime.datetime.now()).total_seconds()
+                    if seconds_remaining <= 0:
+                        break
+                    pbar.n = TOTAL_DAY_SECONDS - int(seconds_remaining)
+                    pbar.refresh()
+                    time.sleep(min(seconds_remaining, PROGRESS_UPDATE_SECONDS))
+
+                run_script()
 
     except KeyboardInterrupt:
         print("\n\n👋 PaperPulse Scheduler Stopped.")
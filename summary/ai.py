@@ -1,13 +1,64 @@
+import asyncio
+import hashlib
+import httpx
 import json
+import orjson
 import os
 import re
+import sys
+sys.path.append(os.getcwd())
+
 from datetime import datetime
-from openai import OpenAI
+from lxml import html as lxml_html
+from openai import AsyncOpenAI
+from utils.storage import load_json, update_json
+
+# Number of summary requests in flight at once
+SUMMARY_MAX_CONCURRENCY = int(os.environ.get("SUMMARY_MAX_CONCURRENCY", 8))
+# Seconds to wait for a single summary before giving up on it
+SUMMARY_TIMEOUT_SECONDS = 180
+# Pooled keep-alive connections to the API, enough for every concurrent request
+API_MAX_CONNECTIONS = 32
+# Maximum number of words of an L2 summary
+L2_LENGTH_LIMIT = 400
+# Number of texts summarized together in one API call
+SUMMARY_BATCH_SIZE = 5
+# Summaries already generated on earlier runs, one file per input text
+SUMMARY_CACHE_DIR = "./materials/.cache"
+# Regex fallback for markup lxml cannot parse:
+# <p> tags and runs of blank lines, both become a single line break
+_P_TAG_NL = re.compile(r"</?p.*?>|\n{2,}")
+# any remaining HTML tag
+_ANY_TAG = re.compile(r"<[^>]*>")
+
+
+def _strip_html(text: str) -> str:
+    """
+    Removes HTML tags from text, ending each paragraph with a line break and
+    collapsing blank lines.
+
+    The markup is handled by lxml's C parser rather than backtracking regexes;
+    text without any tag skips parsing altogether.
+
+    :param text: The text to clean up.
+    :return: The plain text.
+    """
+    if "<" in text:
+        try:
+            root = lxml_html.fromstring(text)
+            for paragraph in root.iter("p"):
+                paragraph.tail = "\n" + (paragraph.tail or "")
+            text = root.text_content()
+        except Exception:
+            return _ANY_TAG.sub("", _P_TAG_NL.sub("\n", text))
+    return "\n".join(filter(None, text.split("\n")))
+
 
 # Define prompts as global variables at the beginning of the file.
 # The variable names are in English, but the content is in Chinese.
 L2_SUMMARIZATION_PROMPT = """你是一个专业的内容总结机器人。请根据用户提供的文本，使用中文进行总结。"""
 L2_USER_PROMPT_TEMPLATE = """请使用中文总结以下内容，字数限制在 {length_limit} 字以内，并且仅输出最终结果。输出内容不允许包含任何Markdown小标题、加粗等标记，请以自然段形式呈现，并且要保证行文的逻辑性是顺畅的，不可以只是做翻译，每一个自然段的内容不要太短也不要太长。\n\n---\n\n{text}"""
+L2_BATCH_USER_PROMPT_TEMPLATE = """下面是一个JSON数组，每个元素包含 id 和 text 两个字段。请使用中文分别总结每个元素的 text，每篇总结的字数限制在 {length_limit} 字以内。总结内容不允许包含任何Markdown小标题、加粗等标记，请以自然段形式呈现，并且要保证行文的逻辑性是顺畅的，不可以只是做翻译，每一个自然段的内容不要太短也不要太长。\n\n请仅输出一个JSON对象，格式为 {{"summaries": [{{"id": <id>, "summary": "<总结>"}}]}}，输入中的每个 id 都必须恰好出现一次。\n\n---\n\n{items}"""
 
 L1_SUMMARIZATION_PROMPT = """你是一个专业的内容总结机器人。请根据用户提供的文本，使用中文进行总结。"""
 L1_USER_PROMPT_TEMPLATE = """接下来我会提供一些paper和GitHub仓库的摘要，摘要内容为：\n\n{text}\n\n请你根据这些摘要，生成一个精简版的总结。要求每个paper或仓库包含：仓库的名称或者Paper的名称，并且在这之后用3到4句话凝练地概括其核心内容。你只需要输出最终的生成结果，并且该结果必须是一个Markdown无序列表，只允许有一层缩进，每个列表元素代表一个paper或仓库的介绍。输出中不允许包含任何Markdown小标题或加粗等标记。"""
@@ -17,15 +68,31 @@ class AISummarizer:
     A class to read data from a JSON file and generate summaries using the OpenAI API.
     """
 
-    def __init__(self):
+    def __init__(self, time_stamp: str = None):
         """
         Initializes the class and authenticates the OpenAI client.
+
+        :param time_stamp: The "%Y%m%d" date of the daily JSON file to summarize,
+                           today if not given.
         """
-        self.time = datetime.now().strftime("%Y%m%d")
+        self.time = datetime.now().strftime("%Y%m%d") if time_stamp is None else time_stamp
         self.data_file_path = os.path.join("./materials", (self.time + ".json"))
-        self.client = OpenAI(
+        # summaries generated but not yet written, flushed in a single update
+        self._summaries_dirty = {}
+        # one HTTP/2 connection pool for all calls, so concurrent requests share
+        # kept-alive connections instead of each paying a TCP + TLS handshake
+        self._httpx = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_CONNECTIONS,
+            ),
+            timeout=60.0,
+        )
+        self.client = AsyncOpenAI(
             api_key=os.environ.get("OPENAI_API_KEY"),
             base_url=os.environ.get("BASE_URL"),
+            http_client=self._httpx,
         )
         if not self.client.api_key:
             raise ValueError(
@@ -40,12 +107,48 @@ class AISummarizer:
             raise FileNotFoundError(f"File not found: {self.data_file_path}")
 
         try:
-            with open(self.data_file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return load_json(self.data_file_path)
         except json.JSONDecodeError:
             raise ValueError("File content is not a valid JSON format.")
 
-    def _get_summary_from_OPENAI(self, text, length_limit=400):
+    def _summary_cache_path(self, text, length_limit):
+        """
+        Returns the cache file of the summary for a given input.
+
+        :param text: The original text to be summarized.
+        :param length_limit: The maximum number of words for the summary.
+        :return: The path of the cache file, named by the SHA-1 of the input.
+        """
+        digest = hashlib.sha1(f"{length_limit}:{text}".encode("utf-8")).hexdigest()
+        return os.path.join(SUMMARY_CACHE_DIR, f"{digest}.txt")
+
+    def _read_cached_summary(self, text, length_limit):
+        """
+        Returns the cached summary for a given input, or None if there is none.
+        """
+        try:
+            with open(self._summary_cache_path(text, length_limit), "r", encoding="utf-8") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_cached_summary(self, text, length_limit, summary):
+        """
+        Atomically stores a generated summary in the cache.
+
+        Only successful answers are cached, failures are retried on the next run.
+        """
+        cache_path = self._summary_cache_path(text, length_limit)
+        try:
+            os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(summary)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Warning: Could not write summary cache: {e}")
+
+    async def _get_summary_from_OPENAI(self, text, length_limit=L2_LENGTH_LIMIT):
         """
         Generates a text summary using the OpenAI API.
 
@@ -53,9 +156,13 @@ class AISummarizer:
         :param length_limit: The maximum number of words for the summary.
         :return: The generated summary string.
         """
+        # Papers and repos often trend for several days, reuse their summaries
+        cached = self._read_cached_summary(text, length_limit)
+        if cached is not None:
+            return cached
+
         # Clean up Markdown and HTML tags
-        clean_text = re.sub(r"</?p.*?>|\n{2,}", "\n", text)
-        clean_text = re.sub(r"<[^>]*>", "", clean_text)
+        clean_text = _strip_html(text)
 
         # Build user prompt using the template
         user_prompt = L2_USER_PROMPT_TEMPLATE.format(
@@ -63,7 +170,7 @@ class AISummarizer:
         )
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 messages=[
                     {"role": "system", "content": L2_SUMMARIZATION_PROMPT},
                     {"role": "user", "content": user_prompt},
@@ -73,13 +180,51 @@ class AISummarizer:
                 temperature=0.15,
             )
             answer = response.choices[0].message.content
-            return answer
-        
         except Exception as e:
             print(f"Failed to call API: {e}")
             return "Summary generation failed."
 
-    def generate_full_report(self):
+        self._write_cached_summary(text, length_limit, answer)
+        return answer
+
+    async def _get_summaries_batch(self, texts, length_limit=L2_LENGTH_LIMIT):
+        """
+        Generates summaries for several texts with a single API call.
+
+        The texts are sent as a JSON array and the model answers with a JSON
+        object, so the prompt prefix and the round-trip are paid once per batch.
+
+        :param texts: The original texts to be summarized.
+        :param length_limit: The maximum number of words for each summary.
+        :return: A dict from the position of each text to its summary; texts
+                 the model left out are missing from it.
+        """
+        items = [{"id": index, "text": _strip_html(text)} for index, text in enumerate(texts)]
+        user_prompt = L2_BATCH_USER_PROMPT_TEMPLATE.format(
+            length_limit=length_limit, items=json.dumps(items, ensure_ascii=False)
+        )
+
+        response = await self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": L2_SUMMARIZATION_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+            model="gpt-4o-mini",
+            max_tokens=2000 * len(texts),
+            temperature=0.15,
+            response_format={"type": "json_object"},
+        )
+        answer = orjson.loads(response.choices[0].message.content)
+
+        summaries = {}
+        for entry in answer.get("summaries", []):
+            index, summary = entry.get("id"), entry.get("summary")
+            if isinstance(index, int) and 0 <= index < len(texts) and isinstance(summary, str):
+                summaries[index] = summary
+                self._write_cached_summary(texts[index], length_limit, summary)
+        return summaries
+
+    async def generate_full_report(self):
         """
         Generates a complete summary report, including papers and projects.
         """
@@ -87,26 +232,87 @@ class AISummarizer:
         papers = data.get("huggingface_papers", [])
         repos = data.get("gh_trendings", [])
 
-        reports = []
+        # (heading, text to summarize) pairs, papers first and then projects
+        tasks = []
 
         # Summarize papers
         for paper in papers:
             title = paper.get("Title", "Untitled").strip()
             summary_text = paper.get("Summary", "No summary information.")
-            summary = self._get_summary_from_OPENAI(summary_text)
-            reports.append(f"{title}\n\n{summary}")
+            tasks.append((title, summary_text))
 
         # Summarize GitHub projects
         for repo in repos:
             repo_url = repo.get("url", "No URL").strip()
             # Summarize combining description and README information
             full_text = f"Project Description: {repo.get('description', '')}\n\nREADME Summary: {repo.get('readme_summary', '')}"
-            summary = self._get_summary_from_OPENAI(full_text)
-            reports.append(f"{repo_url}\n\n{summary}")
+            tasks.append((repo_url, full_text))
+
+        # Cached summaries are used as they are, the rest is summarized in
+        # batches of SUMMARY_BATCH_SIZE texts per API call
+        summaries = [self._read_cached_summary(text, L2_LENGTH_LIMIT) for _, text in tasks]
+        # Identical inputs (a repo surfaced twice, papers without an abstract)
+        # are summarized once, grouped by their cleaned text as sent to the model
+        duplicates = {}
+        for index, summary in enumerate(summaries):
+            if summary is None:
+                duplicates.setdefault(_strip_html(tasks[index][1]), []).append(index)
+        pending = [indices[0] for indices in duplicates.values()]
+
+        # The API calls are network-bound, so all batches are awaited concurrently
+        # on one event loop
+        semaphore = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+
+        async def summarize_one(index):
+            try:
+                async with semaphore:
+                    summaries[index] = await asyncio.wait_for(
+                        self._get_summary_from_OPENAI(tasks[index][1]),
+                        SUMMARY_TIMEOUT_SECONDS,
+                    )
+            except Exception as e:
+                print(f"Failed to call API: {e!r}")
+                summaries[index] = "Summary generation failed."
+
+        async def summarize_batch(indices):
+            try:
+                async with semaphore:
+                    batch = await asyncio.wait_for(
+                        self._get_summaries_batch([tasks[index][1] for index in indices]),
+                        SUMMARY_TIMEOUT_SECONDS,
+                    )
+            except Exception as e:
+                print(f"Failed to call API for a batch: {e!r}")
+                batch = {}
+
+            # texts the model left out, or a failed batch, fall back to single calls
+            missing = []
+            for position, index in enumerate(indices):
+                if position in batch:
+                    summaries[index] = batch[position]
+                else:
+                    missing.append(index)
+            await asyncio.gather(*[summarize_one(index) for index in missing])
+
+        await asyncio.gather(
+            *[
+                summarize_batch(pending[start : start + SUMMARY_BATCH_SIZE])
+                for start in range(0, len(pending), SUMMARY_BATCH_SIZE)
+            ]
+        )
+
+        for first, *others in duplicates.values():
+            for index in others:
+                summaries[index] = summaries[first]
+
+        reports = [
+            f"{heading}\n\n{summary}" for (heading, _), summary in zip(tasks, summaries)
+        ]
 
         self.final_report = reports
+        self._summaries_dirty["L2 Summary"] = reports
 
-    def generate_L1_report(self):
+    async def generate_L1_report(self):
         """
         Generates a concise, high-level summary (L1 report).
         """
@@ -114,7 +320,7 @@ class AISummarizer:
         user_prompt = L1_USER_PROMPT_TEMPLATE.format(text=L2_text)
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 messages=[
                     {"role": "system", "content": L1_SUMMARIZATION_PROMPT},
                     {"role": "user", "content": user_prompt},
@@ -127,43 +333,43 @@ class AISummarizer:
         except Exception as e:
             print(f"Failed to call OpenAI API: {e}")
             self.L1_summary = "Summary generation failed."
+        self._summaries_dirty["L1 Summary"] = self.L1_summary
 
-    def save_L2_summary(self):
+    def _flush_summaries(self):
         """
-        Saves the L2 summary to the JSON file.
+        Saves the pending L1 and L2 summaries to the JSON file in one update.
         """
-        with open(self.data_file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        
-        data["L2 Summary"] = self.final_report
+        if not self._summaries_dirty:
+            return
+        update_json(self.data_file_path, self._summaries_dirty)
+        self._summaries_dirty = {}
 
-        with open(self.data_file_path, "w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
-
-    def save_L1_summary(self):
+    async def _run_async(self):
         """
-        Saves the L1 summary to the JSON file.
+        Generates and saves the L2 and then the L1 summaries on one event loop.
         """
-        with open(self.data_file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        
-        data["L1 Summary"] = self.L1_summary
+        try:
+            print("Generate Full Report")
+            await self.generate_full_report()
 
-        with open(self.data_file_path, "w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
+            print("Generate L1 Summary")
+            await self.generate_L1_report()
+            self._flush_summaries()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        Closes the pooled HTTP connections of the API client.
+        """
+        await self._httpx.aclose()
 
     def run(self):
         """
         Main execution function to load data, generate, and save summaries.
         """
         try:
-            print("Generate Full Report")
-            self.generate_full_report()
-            self.save_L2_summary()
-
-            print("Generate L1 Summary")
-            self.generate_L1_report()
-            self.save_L1_summary()
+            asyncio.run(self._run_async())
         except FileNotFoundError as e:
             print(f"Error: {e}. Please ensure the JSON data file exists.")
         except ValueError as e:
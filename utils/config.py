@@ -0,0 +1,38 @@
+import functools
+import json
+import os
+
+from types import MappingProxyType
+
+# Mail config shared by the senders and the report runner
+CONFIG_PATH = "./mail/config.json"
+
+
+@functools.lru_cache(maxsize=64)
+def _read_config(config_path: str, mtime_ns: int) -> MappingProxyType:
+    """
+    Parses a JSON config file. Cached per (path, modification time) pair.
+    """
+    with open(config_path, "r", encoding="utf-8") as file:
+        return MappingProxyType(json.load(file))
+
+
+def get_config(config_path: str = CONFIG_PATH) -> MappingProxyType:
+    """
+    Loads a JSON config file, parsing it only once per file version.
+
+    Every caller shares the same parsed object, so it is returned as a
+    read-only mapping. The modification time is part of the cache key, so an
+    edited config file is parsed again while repeated loads of an unchanged
+    one are a stat and a dict lookup.
+
+    Args:
+        config_path (str): Path to the JSON config file.
+
+    Returns:
+        MappingProxyType: The parsed config.
+
+    Raises:
+        FileNotFoundError: If the config file does not exist.
+    """
+    return _read_config(config_path, os.stat(config_path).st_mtime_ns)
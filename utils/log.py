@@ -1,25 +1,450 @@
+import atexit
 import logging
 import os
+import queue
+import signal
 import sys
+import threading
+import time
 
-from datetime import datetime
-from pathlib import Path
+# (epoch second, formatted string) of the last generate_timestamp() call
+_last_timestamp = (None, "")
+# log directory of each working directory, resolved by _get_log_dir()
+_LOG_DIR_CACHE = {}
 
 
 # utils
 def generate_timestamp():
-    return datetime.now().strftime("%Y%m%d-%H%M%S")
+    """
+    Returns the local time as "%Y%m%d-%H%M%S".
+
+    The string only changes once per second, so it is formatted at most once per
+    second; the cache is a single tuple, replaced atomically, so no lock is needed.
+    """
+    global _last_timestamp
+    now = int(time.time())
+    second, formatted = _last_timestamp
+    if now != second:
+        formatted = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        _last_timestamp = (now, formatted)
+    return formatted
 
 
+# Every record of the process pays for these LogRecord attributes, none of which
+# is in the log format: the thread and process lookups, and the stack walk of
+# findCaller for the file name and line number.
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+logging._srcfile = None
+
 # Define a constant for the shared logger name
 SHARED_LOGGER_NAME = "EMAIL"
+# Layout of a log record, see BytesFormatter
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s]: %(message)s"
+# Size of the write buffer of the log file
+LOG_FILE_BUFFER_SIZE = 64 * 1024
+# Directory of the log file when ./log is not writable
+TMP_LOG_DIR = "/tmp"
+# Size in bytes at which the log file is rotated and gzipped, e.g. 67108864 for
+# 64 MiB; 0 (the default) keeps a single growing file
+LOG_ROTATE_MAX_BYTES = int(os.environ.get("LOG_ROTATE_MAX_BYTES", 0))
+# Number of gzipped log files kept by the rotation
+LOG_ROTATE_BACKUP_COUNT = 5
+# Seconds the SIGTERM handler waits at most for the listener to drain the queue
+SIGTERM_FLUSH_TIMEOUT = 2
+
+# The handler writing the log file and the console, the thread running it and
+# the queue feeding that thread, set up by setup_logging_config()
+_handler = None
+_listener = None
+_queue = None
+# The configured shared logger, and the lock serializing its first configuration
+_LOGGER = None
+_LOCK = threading.Lock()
+
+
+def flush_logs(timeout=None):
+    """
+    Writes every record logged so far to the log file.
+
+    Records are flushed on their own once the buffer is full, on ERROR and above,
+    and at exit; call this where the log file must be up to date, e.g. before
+    handing it to another process. A marker record is queued behind the records
+    logged so far; the listener thread flushes the handler when it reaches the
+    marker and sets the marker's event, which this waits for.
+
+    Args:
+        timeout (float, optional): Seconds to wait at most for the listener.
+
+    Returns:
+        bool: False if the listener did not reach the marker within timeout.
+    """
+    log_queue = _queue
+    if log_queue is None:
+        return True
+    marker = logging.makeLogRecord({"levelno": logging.CRITICAL})
+    flushed = marker.flush_event = threading.Event()
+    log_queue.put(marker)
+    return flushed.wait(timeout)
+
+
+def _shutdown_logging():
+    """
+    Drains the log queue and writes every buffered record to the log file.
+
+    Runs at exit; any later call does nothing.
+    """
+    global _listener, _handler, _queue
+    if _listener is not None:
+        _queue = None
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        _handler.close()
+        _handler = None
+
+
+def _flush_on_sigterm(signum, frame):
+    """
+    Writes the records logged so far, then terminates the way SIGTERM would have.
+
+    The handler runs in the main thread, which may have been interrupted while
+    holding a lock the listener thread needs, so it never joins the listener:
+    it waits at most SIGTERM_FLUSH_TIMEOUT seconds for flush_logs(), and if the
+    listener did not get there it writes the pending file buffer itself,
+    provided the handler lock is free.
+    """
+    handler = _handler
+    if not flush_logs(SIGTERM_FLUSH_TIMEOUT) and handler is not None:
+        handler.write_pending_nowait()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+class DualHandler(logging.Handler):
+    """
+    Writes each log record to the log file and, from WARNING on, to stdout.
+
+    A single handler formats every record once and takes one lock, where a file
+    handler and a console handler would each do both. Without a file name only
+    the console part is active. Records are formatted straight to bytes, so the
+    formatter must provide format_bytes(), as BytesFormatter does.
+
+    The log file is appended to through a raw O_APPEND file descriptor that stays
+    open for the lifetime of the handler, since the file name embeds its creation
+    time and the file is never rotated under us. Encoded records collect in a
+    bytearray and reach the file with a single os.write once LOG_FILE_BUFFER_SIZE
+    bytes are pending; the buffer is also written on ERROR and above, by
+    flush_logs() and on close. O_APPEND makes each write land at the end of the
+    file, also when several processes share it.
+
+    With max_bytes set, a log file that has grown past it is renamed to a unique
+    temporary name and compressed by a background gzip process, and a new file is
+    started. Finished gzip processes are reaped with poll() on the following
+    writes, never waited for except on close: then older backups are shifted up
+    to backup_count and the result becomes <name>.1.gz, in rotation order, so
+    gzip never reads a file that is renamed under it.
+    """
+
+    def __init__(
+        self,
+        filename=None,
+        file_level=logging.INFO,
+        console_level=logging.WARNING,
+        buffer_size=LOG_FILE_BUFFER_SIZE,
+        max_bytes=LOG_ROTATE_MAX_BYTES,
+        backup_count=LOG_ROTATE_BACKUP_COUNT,
+    ):
+        super().__init__(console_level if filename is None else min(file_level, console_level))
+        self.filename = filename
+        self.fd = None if filename is None else self._open()
+        self.file_level = file_level
+        self.console_level = console_level
+        self.buffer_size = buffer_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._pending = bytearray()
+        # (gzip process or None, rotated file) of each rotation not yet filed as
+        # <name>.1.gz, oldest first
+        self._compressions = []
+        # size of the log file, only tracked when it is rotated
+        self._size = 0 if self.fd is None or not max_bytes else os.fstat(self.fd).st_size
+        self.setFormatter(BytesFormatter())
+
+    def _open(self):
+        return os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _write_pending(self):
+        while self._pending:
+            written = os.write(self.fd, self._pending)
+            del self._pending[:written]
+            self._size += written
+        if self._compressions:
+            self._file_backups()
+        if self.max_bytes and self._size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        # only loaded by processes that actually rotate their log
+        import subprocess
+
+        # the old descriptor is only closed once the new one is open, so self.fd
+        # is a valid descriptor whichever step fails
+        rotated = f"{self.filename}.{time.time_ns()}"
+        os.replace(self.filename, rotated)
+        try:
+            fd = self._open()
+        except OSError:
+            os.replace(rotated, self.filename)
+            raise
+        old_fd, self.fd = self.fd, fd
+        os.close(old_fd)
+        self._size = 0
+        try:
+            process = subprocess.Popen(["gzip", "-f", rotated])
+        except OSError as e:
+            # without gzip the backup is kept uncompressed
+            print(f"Warning: Could not compress rotated log file {rotated}: {e}", file=sys.stderr)
+            process = None
+        self._compressions.append((process, rotated))
+
+    def _file_backups(self, wait=False):
+        """
+        Files the output of each finished gzip as the newest backup, after
+        shifting the older ones.
+
+        Stops at the first gzip still running, unless wait is set, so backups
+        are filed in rotation order.
+        """
+        while self._compressions:
+            process, rotated = self._compressions[0]
+            if process is None:
+                returncode = None
+            else:
+                returncode = process.wait() if wait else process.poll()
+                if returncode is None:
+                    return
+            del self._compressions[0]
+            if returncode == 0:
+                source, suffix = f"{rotated}.gz", ".gz"
+            else:
+                source, suffix = rotated, ""
+            try:
+                for index in range(self.backup_count - 1, 0, -1):
+                    for backup_suffix in (".gz", ""):
+                        backup = f"{self.filename}.{index}{backup_suffix}"
+                        if os.path.exists(backup):
+                            os.replace(backup, f"{self.filename}.{index + 1}{backup_suffix}")
+                os.replace(source, f"{self.filename}.1{suffix}")
+            except OSError as e:
+                print(f"Warning: Could not file rotated log file {source}: {e}", file=sys.stderr)
+
+    def handle(self, record):
+        # the marker queued by flush_logs() is not written, it flushes the buffer
+        flushed = getattr(record, "flush_event", None)
+        if flushed is None:
+            return super().handle(record)
+        try:
+            self.flush()
+        finally:
+            flushed.set()
+        return True
+
+    def emit(self, record):
+        try:
+            # encoded once for both targets
+            data = self.formatter.format_bytes(record)
+            if self.fd is not None and record.levelno >= self.file_level:
+                self._pending += data
+                if record.levelno >= logging.ERROR or len(self._pending) >= self.buffer_size:
+                    self._write_pending()
+            if record.levelno >= self.console_level:
+                self._write_console(data)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _write_console(self, data):
+        # The bytes go straight to the binary buffer of stdout, skipping the
+        # encoding and newline translation of its TextIOWrapper; text already
+        # written to stdout (e.g. by print) is flushed first to keep the order.
+        # A replaced stdout without a binary buffer gets the decoded str.
+        stdout = sys.stdout
+        buffer = getattr(stdout, "buffer", None)
+        if buffer is None:
+            stdout.write(data.decode("utf-8"))
+            stdout.flush()
+        else:
+            stdout.flush()
+            buffer.write(data)
+            buffer.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.fd is not None:
+                self._write_pending()
+        finally:
+            self.release()
+
+    def write_pending_nowait(self):
+        """
+        Writes the buffered records to the log file without rotating it, unless
+        another thread holds the handler lock; safe to call from a signal handler.
+        """
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            while self.fd is not None and self._pending:
+                del self._pending[:os.write(self.fd, self._pending)]
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.fd is not None:
+                self._write_pending()
+                os.close(self.fd)
+                self.fd = None
+            self._file_backups(wait=True)
+        finally:
+            self.release()
+        super().close()
+
+
+class CachedTimeFormatter(logging.Formatter):
+    """
+    A Formatter that runs strftime for asctime at most once per second.
+
+    Records logged within the same second share the date and time string, only
+    the milliseconds are added per record, so the output is the same as with
+    logging.Formatter.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (epoch second, formatted date and time) of the last record
+        self._time_cache = (None, "")
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, formatted = self._time_cache
+        if second != cached_second:
+            formatted = time.strftime(
+                datefmt or self.default_time_format, self.converter(second)
+            )
+            self._time_cache = (second, formatted)
+        if datefmt:
+            return formatted
+        return self.default_msec_format % (formatted, record.msecs)
+
+
+class BytesFormatter(CachedTimeFormatter):
+    """
+    Formats log records in the LOG_FORMAT layout straight to UTF-8 bytes.
+
+    The constant parts are encoded once and reused: the " [name]: " separator
+    per logger name and the level name per level. Only the time and the message
+    are encoded per record. format() still returns the same line as a str.
+    """
+
+    def __init__(self):
+        super().__init__(LOG_FORMAT)
+        # encoded " [name]: " separators and level names
+        self._name_parts = {}
+        self._level_parts = {}
+
+    def format_bytes(self, record):
+        """
+        Returns the formatted record as UTF-8 bytes, ending with a newline.
+        """
+        name_part = self._name_parts.get(record.name)
+        if name_part is None:
+            name_part = self._name_parts[record.name] = f" [{record.name}]: ".encode("utf-8")
+        level_part = self._level_parts.get(record.levelname)
+        if level_part is None:
+            level_part = self._level_parts[record.levelname] = record.levelname.encode("utf-8")
+
+        # the same message, exception and stack handling as Formatter.format
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            if message[-1:] != "\n":
+                message += "\n"
+            message += record.exc_text
+        if record.stack_info:
+            if message[-1:] != "\n":
+                message += "\n"
+            message += self.formatStack(record.stack_info)
+
+        return b"%s %s%s%s\n" % (
+            self.formatTime(record, self.datefmt).encode("ascii"),
+            level_part,
+            name_part,
+            message.encode("utf-8", "replace"),
+        )
+
+
+def _ensure_dir(path):
+    """
+    Creates a directory if it is missing.
+
+    A single stat settles the common case of an existing directory; makedirs,
+    with its own checks, only runs when that stat fails.
+    """
+    try:
+        os.stat(path)
+    except FileNotFoundError:
+        os.makedirs(path, exist_ok=True)
+
+
+def _get_log_dir(cwd):
+    """
+    Returns the log directory under a working directory, creating it if missing.
+
+    The result is cached per working directory, so later calls make no syscall.
+    """
+    log_dir = _LOG_DIR_CACHE.get(cwd)
+    if log_dir is None:
+        log_dir = os.path.join(cwd, "log")
+        _ensure_dir(log_dir)
+        _LOG_DIR_CACHE[cwd] = log_dir
+    return log_dir
 
 
 def setup_logging_config():
     """
     Configures and returns a shared logger instance.
     Ensures that the configuration is done only once to avoid duplicate handlers.
+
+    Pass message arguments separately, e.g. logger.debug("%s: %s", key, value),
+    so that records below the logger level are never formatted.
     """
+    global _LOGGER
+
+    # After the first call this is a single global lookup; the lock only guards
+    # threads racing to configure the logger for the first time
+    if _LOGGER is not None:
+        return _LOGGER
+    with _LOCK:
+        if _LOGGER is None:
+            _LOGGER = _configure_logger()
+    return _LOGGER
+
+
+def _configure_logger():
+    """
+    Attaches the handlers to the shared logger, see setup_logging_config().
+    """
+    # logging.handlers is a sizeable import, only paid by processes that log
+    from logging.handlers import QueueHandler, QueueListener
+
+    global _handler, _listener, _queue
+
     # Attempt to get the existing logger instance
     logger = logging.getLogger(SHARED_LOGGER_NAME)
 
@@ -29,58 +454,56 @@ def setup_logging_config():
         return logger
 
     # If the logger is not configured, proceed with configuration.
-    logger.setLevel(logging.INFO)  # Set the minimum logging level for the logger.
-
-    log_dir_home = Path.cwd() / "log"
-    log_file_path = None
+    # The file part records INFO level and above, the console part (stdout)
+    # only WARNING level and above.
+    cwd = os.getcwd()
 
     try:
-        log_dir_home.mkdir(parents=True, exist_ok=True)
-        potential_log_file_path = log_dir_home / f"Email_{generate_timestamp()}.log"
-
-        # Try to create or open the file to check for write permissions.
-        with potential_log_file_path.open("a", encoding="utf-8") as f:
-            f.write("")  # Try to write an empty string to ensure writability.
-        log_file_path = str(potential_log_file_path)
+        log_dir_home = _get_log_dir(cwd)
+        # Opening the file for the handler is the write permission check,
+        # so no separate probe write is needed.
+        _handler = DualHandler(
+            os.path.join(log_dir_home, f"Email_{generate_timestamp()}.log")
+        )
     except OSError as e:
         print(
-            f"Warning: Could not create or write to log file at '{log_dir_home}'. Using /tmp instead. Error: {e}",
+            f"Warning: Could not create or write to log file at '{os.path.join(cwd, 'log')}'. Using /tmp instead. Error: {e}",
             file=sys.stderr,
         )
-        tmp_dir = Path("/tmp")
-        log_file_path = str(tmp_dir / "API.log")
         try:
-            tmp_dir.mkdir(parents=True, exist_ok=True)
-            with (tmp_dir / "API.log").open("a", encoding="utf-8") as f:
-                f.write("")  # Try again to ensure writability in /tmp.
+            # no probe write, opening the file is the check that /tmp is writable
+            _ensure_dir(TMP_LOG_DIR)
+            _handler = DualHandler(os.path.join(TMP_LOG_DIR, "API.log"))
         except OSError as e:
             print(
                 f"Critical Warning: Could not create or write to log file in /tmp. File logging will be disabled. Error: {e}",
                 file=sys.stderr,
             )
-            log_file_path = None  # Could not write to file, disabling file logging.
-
-    # Define the log format.
-    formatter = logging.Formatter("%(asctime)s %(levelname)s [%(name)s]: %(message)s")
-
-    # File Handler
-    if log_file_path:
-        file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-        file_handler.setLevel(
-            logging.INFO
-        )  # The file handler records INFO level and above.
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-
-    # Console Handler
-    console_handler = logging.StreamHandler(
-        sys.stdout
-    )  # Explicitly direct output to stdout.
-    console_handler.setLevel(
-        logging.WARNING
-    )  # The console handler only records WARNING level and above.
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+            _handler = DualHandler()  # Could not write to file, disabling file logging.
+
+    # The logger level is the lowest level the handler writes, so records nobody
+    # would write are dropped before a LogRecord is even built; WARNING when file
+    # logging is disabled.
+    logger.setLevel(_handler.level)
+
+    # The logger itself only puts records on a queue, so the calling thread never
+    # waits for disk or console I/O; a single listener thread owns the real handler
+    # and writes the records in order. It is stopped at exit, after draining the queue.
+    _queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(_queue))
+    _listener = QueueListener(
+        _queue, _handler, respect_handler_level=True
+    )
+    _listener.start()
+
+    # Records are only written in batches, so the buffers are drained at exit and,
+    # unless the application handles SIGTERM itself, when the process is terminated
+    atexit.register(_shutdown_logging)
+    if (
+        threading.current_thread() is threading.main_thread()
+        and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+    ):
+        signal.signal(signal.SIGTERM, _flush_on_sigterm)
 
     # Disable propagation to prevent log events from being passed to the root logger, which would cause duplicate output.
     logger.propagate = False
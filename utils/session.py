@@ -0,0 +1,30 @@
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_session(headers: dict | None = None) -> requests.Session:
+    """
+    Creates a requests.Session with a keep-alive connection pool and retries.
+
+    Reusing the session across requests avoids a fresh TCP + TLS handshake
+    for every call to the same host.
+
+    Args:
+        headers (dict | None): Default headers sent with every request.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+
+    retries = Retry(
+        total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,79 @@
+import fcntl
+import json
+import os
+import orjson
+
+# Directory, next to the data files, holding the lock files of update_json
+LOCK_DIR_NAME = ".locks"
+
+
+def load_json(path: str):
+    """
+    Loads a JSON file with orjson.
+
+    Args:
+        path (str): The path of the JSON file.
+
+    Returns:
+        The decoded JSON content.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        orjson.JSONDecodeError: If the content is not valid JSON
+                                (a subclass of json.JSONDecodeError).
+    """
+    with open(path, "rb") as file:
+        return orjson.loads(file.read())
+
+
+def save_json(path: str, data) -> None:
+    """
+    Atomically writes data to a JSON file with orjson.
+
+    The content is written to a sibling ".tmp" file first and then moved over
+    the target with os.replace, so a crash mid-write never leaves a truncated
+    file behind.
+
+    Args:
+        path (str): The path of the JSON file.
+        data: The JSON-serializable data to write.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, path)
+
+
+def update_json(path: str, updates: dict) -> None:
+    """
+    Merges top-level keys into a JSON object file under an exclusive lock.
+
+    The read-modify-write runs while holding flock on a lock file in the
+    ".locks" directory next to the data file, so concurrent writers of the
+    same file (e.g. the paper and GitHub scrapers) cannot drop each other's
+    keys. A separate lock file is used because save_json replaces the data
+    file's inode; keeping it in its own directory leaves none behind among
+    the data files.
+
+    Args:
+        path (str): The path of the JSON file.
+        updates (dict): The top-level keys and values to set.
+    """
+    lock_dir = os.path.join(os.path.dirname(path), LOCK_DIR_NAME)
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_path = os.path.join(lock_dir, f"{os.path.basename(path)}.lock")
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                data = load_json(path)
+            except FileNotFoundError:
+                data = {}
+            except json.JSONDecodeError as e:
+                print(f"Warning: Could not read existing JSON file {path}. Error: {e}")
+                data = {}
+
+            data.update(updates)
+            save_json(path, data)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)